@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BotConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "bot"
+
+    def ready(self):
+        # Log I/O runs on a listener thread instead of the request path
+        from bot.utils.log_queue import install_queue_logging
+        install_queue_logging('bot')
@@ -37,7 +37,7 @@ class CommandHandler:
             command = parts[0].lower()
             args = parts[1] if len(parts) > 1 else ''
             
-            logger.info(f"🎯 Handling command: {command} from {chat_id}")
+            logger.info("🎯 Handling command: %s from %s", command, chat_id)
             
             if command == '/start':
                 self.handle_start(chat_id, args, platform='telegram')
@@ -57,7 +57,7 @@ class CommandHandler:
                 self.handle_unknown(chat_id, command, platform='telegram')
                 
         except Exception as e:
-            logger.error(f"❌ Command handling error: {e}")
+            logger.error("❌ Command handling error: %s", e)
             self._send_response('telegram', chat_id, "❌ Sorry, there was an error processing your command.")
 
     async def handle_platform_command(self, user_data, command, args):
@@ -66,7 +66,7 @@ class CommandHandler:
             platform = user_data.get('platform', 'telegram')
             user_id = user_data['user_id']
             
-            logger.info(f"🎯 Handling {platform} command: {command} from {user_id}")
+            logger.info("🎯 Handling %s command: %s from %s", platform, command, user_id)
             
             if command == 'start':
                 await self.handle_start(user_id, args, platform)
@@ -86,7 +86,7 @@ class CommandHandler:
                 await self.handle_unknown(user_id, command, platform)
                 
         except Exception as e:
-            logger.error(f"❌ Platform command handling error: {e}")
+            logger.error("❌ Platform command handling error: %s", e)
             await self._send_response_async(platform, user_id, "❌ Sorry, there was an error processing your command.")
 
     async def handle_start(self, user_id, args, platform='telegram'):
@@ -388,7 +388,8 @@ Near Kenya National Archives building.
         user_data = {'platform': platform, 'user_id': user_id}
         
         # This will use the message handler's language system
-        return message_handler.get_response(user_id, response_type)
+        language = await self._get_user_language(platform, user_id)
+        return message_handler.get_response(user_id, response_type, language=language)
 
     def _send_response(self, platform, user_id, message):
         """Sync response sending"""
@@ -397,7 +398,7 @@ Near Kenya National Archives building.
             telegram.send_message(user_id, message)
         elif platform == 'whatsapp':
             # WhatsApp would be async, but this is sync context
-            logger.info(f"📤 Would send WhatsApp message to {user_id}: {message}")
+            logger.info("📤 Would send WhatsApp message to %s: %s", user_id, message)
 
     async def _send_response_async(self, platform, user_id, message, quick_replies=None):
         """Async response sending"""
@@ -414,4 +415,4 @@ Near Kenya National Archives building.
                 else:
                     await whatsapp.send_message(user_id, message)
         except Exception as e:
-            logger.error(f"❌ Error sending {platform} response: {e}")
\ No newline at end of file
+            logger.error("❌ Error sending %s response: %s", platform, e)
\ No newline at end of file
@@ -1,5 +1,6 @@
 # bot/handlers/conversation_handler.py
 import logging
+import re
 from datetime import datetime, timedelta
 from .conversation_states import (
     ConversationState,
@@ -13,42 +14,49 @@ from .conversation_states import (
 
 logger = logging.getLogger(__name__)
 
+# Phone validation patterns, compiled once
+_NON_DIGIT_RE = re.compile(r'\D')
+_KENYAN_PHONE_RE = re.compile(r'^(\+?254|0)[17]\d{8}$')
+
+# Whole-message replies accepted at the confirmation step
+_CONFIRM_WORDS = frozenset(('yes', 'y', 'confirm', 'ok'))
+_DECLINE_WORDS = frozenset(('no', 'cancel'))
+
 class ConversationHandler:
     def __init__(self, bot_instance):
         self.bot = bot_instance
         
+        # Conversation state -> step handler(chat_id, text); unknown states fall back to idle
+        self._state_handlers = {
+            ConversationState.IDLE: self.handle_idle_state,
+            ConversationState.VIEWING_SERVICES: self.handle_viewing_services,
+            ConversationState.AWAITING_SERVICE: self.handle_awaiting_service,
+            ConversationState.AWAITING_DATE: self.handle_awaiting_date,
+            ConversationState.AWAITING_TIME: self.handle_awaiting_time,
+            ConversationState.AWAITING_NAME: self.handle_awaiting_name,
+            ConversationState.AWAITING_PHONE: self.handle_awaiting_phone,
+            ConversationState.AWAITING_CONFIRMATION: self.handle_awaiting_confirmation,
+        }
+        
     def process_message(self, chat_id, text):
         """Main entry point for processing messages"""
-        logger.info(f"Processing message from {chat_id}: {text}")
+        logger.info("Processing message from %s: %s", chat_id, text)
         
         # Add to conversation history
         add_to_conversation_history(chat_id, 'user', text)
         
         # Get current state
         current_state = get_user_state(chat_id)
-        logger.info(f"Current state: {current_state}")
+        logger.info("Current state: %s", current_state)
         
         # Handle based on state
-        if current_state == ConversationState.IDLE:
-            return self.handle_idle_state(chat_id, text)
-        elif current_state == ConversationState.VIEWING_SERVICES:
-            return self.handle_viewing_services(chat_id, text)
-        elif current_state == ConversationState.AWAITING_SERVICE:
-            return self.handle_awaiting_service(chat_id, text)
-        elif current_state == ConversationState.AWAITING_DATE:
-            return self.handle_awaiting_date(chat_id, text)
-        elif current_state == ConversationState.AWAITING_TIME:
-            return self.handle_awaiting_time(chat_id, text)
-        elif current_state == ConversationState.AWAITING_NAME:
-            return self.handle_awaiting_name(chat_id, text)
-        elif current_state == ConversationState.AWAITING_PHONE:
-            return self.handle_awaiting_phone(chat_id, text)
-        elif current_state == ConversationState.AWAITING_CONFIRMATION:
-            return self.handle_awaiting_confirmation(chat_id, text)
-        else:
-            # Default to idle state
-            set_user_state(chat_id, ConversationState.IDLE)
-            return self.handle_idle_state(chat_id, text)
+        handler = self._state_handlers.get(current_state)
+        if handler is not None:
+            return handler(chat_id, text)
+        
+        # Default to idle state
+        set_user_state(chat_id, ConversationState.IDLE)
+        return self.handle_idle_state(chat_id, text)
     
     def handle_idle_state(self, chat_id, text):
         """Handle messages in idle state"""
@@ -210,7 +218,7 @@ class ConversationHandler:
         """Handle confirmation"""
         text_lower = text.lower()
         
-        if text_lower in ['yes', 'y', 'confirm', 'ok']:
+        if text_lower in _CONFIRM_WORDS:
             # Confirm appointment
             appointment = get_appointment_data(chat_id)
             success = self.bot.save_appointment(chat_id, appointment)
@@ -222,7 +230,7 @@ class ConversationHandler:
                 set_user_state(chat_id, ConversationState.IDLE)
                 return self.bot.send_appointment_error(chat_id)
         
-        elif text_lower in ['no', 'cancel']:
+        elif text_lower in _DECLINE_WORDS:
             set_user_state(chat_id, ConversationState.IDLE)
             return self.bot.send_appointment_cancelled(chat_id)
         
@@ -301,8 +309,6 @@ class ConversationHandler:
         return None
     
     def is_valid_phone(self, text):
-        import re
         # Simple validation for Kenyan phone numbers
-        pattern = r'^(\+?254|0)[17]\d{8}$'
-        cleaned = re.sub(r'\D', '', text)
-        return bool(re.match(pattern, cleaned))
\ No newline at end of file
+        cleaned = _NON_DIGIT_RE.sub('', text)
+        return bool(_KENYAN_PHONE_RE.match(cleaned))
\ No newline at end of file
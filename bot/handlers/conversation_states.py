@@ -34,7 +34,7 @@ def get_user_state(chat_id):
 def set_user_state(chat_id, state):
     """Set conversation state for user"""
     user_states[chat_id] = state
-    logger.debug(f"State updated for {chat_id}: {state}")
+    logger.debug("State updated for %s: %s", chat_id, state)
 
 def clear_user_state(chat_id):
     """Clear all user states and data"""
@@ -144,7 +144,7 @@ def reset_to_idle_after_timeout(chat_id, timeout_minutes=30):
         time_diff = (datetime.now() - last_activity_time).total_seconds() / 60
         
         if time_diff > timeout_minutes:
-            logger.info(f"Resetting {chat_id} to idle due to timeout")
+            logger.info("Resetting %s to idle due to timeout", chat_id)
             clear_user_state(chat_id)
             return True
     
@@ -287,21 +287,24 @@ def set_user_language(chat_id, language):
     """Set user's preferred language"""
     user_language[chat_id] = language
 
+# Built once; callers get the same tuple every time
+_STATE_FUNCTIONS = (
+    get_user_state, set_user_state, clear_user_state,
+    get_appointment_data, set_appointment_data, clear_appointment_data,
+    get_conversation_context, set_conversation_context,
+    get_user_language, set_user_language
+)
+
 def _get_conversation_states():
     """Get all conversation state functions for easy access"""
-    return (
-        get_user_state, set_user_state, clear_user_state,
-        get_appointment_data, set_appointment_data, clear_appointment_data,
-        get_conversation_context, set_conversation_context,
-        get_user_language, set_user_language
-    )
+    return _STATE_FUNCTIONS
 
 def cleanup_old_sessions(hours=24):
     """Clean up old conversation sessions"""
     cutoff_time = datetime.now().timestamp() - (hours * 3600)
     
     # Simple cleanup - in production, track session creation time
-    logger.info(f"Cleaning up sessions older than {hours} hours")
+    logger.info("Cleaning up sessions older than %s hours", hours)
     
     # Remove sessions with no recent activity
     chats_to_remove = []
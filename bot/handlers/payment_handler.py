@@ -32,7 +32,7 @@ class PaymentHandler:
     def show_payment_options(self, user_id, service_type, amount, platform='telegram'):
         """Show payment options to user - Updated for multi-platform"""
         try:
-            logger.info(f"💰 Showing payment options for {platform} user {user_id}: {service_type} - KES {amount}")
+            logger.info("💰 Showing payment options for %s user %s: %s - KES %s", platform, user_id, service_type, amount)
             
             service_display = self._get_service_display_name(service_type)
             
@@ -79,7 +79,7 @@ class PaymentHandler:
                 self._show_whatsapp_payment_options(user_id, message, service_type, amount)
                 
         except Exception as e:
-            logger.error(f"❌ Error showing payment options: {e}")
+            logger.error("❌ Error showing payment options: %s", e)
             self._send_platform_message(platform, user_id, "❌ Sorry, error showing payment options.")
 
     def _show_telegram_payment_options(self, user_id, message, service_type, amount):
@@ -99,10 +99,10 @@ class PaymentHandler:
             ]
             
             telegram.send_message_with_buttons(user_id, message, buttons)
-            logger.info(f"✅ Telegram payment options sent to {user_id}")
+            logger.info("✅ Telegram payment options sent to %s", user_id)
             
         except Exception as e:
-            logger.error(f"❌ Telegram payment options error: {e}")
+            logger.error("❌ Telegram payment options error: %s", e)
 
     def _show_whatsapp_payment_options(self, user_id, message, service_type, amount):
         """Show payment options for WhatsApp"""
@@ -115,12 +115,12 @@ class PaymentHandler:
                 "Cash at Salon"
             ]
             
-            import asyncio
-            asyncio.run(whatsapp.send_quick_reply(user_id, message, quick_replies))
-            logger.info(f"✅ WhatsApp payment options sent to {user_id}")
+            from bot.services import event_loop
+            event_loop.submit(whatsapp.send_quick_reply(user_id, message, quick_replies))
+            logger.info("✅ WhatsApp payment options queued for %s", user_id)
             
         except Exception as e:
-            logger.error(f"❌ WhatsApp payment options error: {e}")
+            logger.error("❌ WhatsApp payment options error: %s", e)
 
     def initiate_mpesa_checkout(self, chat_id, service_type, amount, platform='telegram'):
         """Initiate M-Pesa STK Push flow - Updated for multi-platform"""
@@ -130,12 +130,30 @@ class PaymentHandler:
             
             # Set state to await phone number
             self._set_awaiting_phone(chat_id, service_type, amount, platform)
-            logger.info(f"🔄 Initiated M-Pesa checkout for {service_type}, amount: {amount}")
+            logger.info("🔄 Initiated M-Pesa checkout for %s, amount: %s", service_type, amount)
             
         except Exception as e:
-            logger.error(f"❌ Error initiating M-Pesa checkout: {e}")
+            logger.error("❌ Error initiating M-Pesa checkout: %s", e)
             self._send_platform_message(platform, chat_id, "❌ Sorry, error starting payment.")
 
+    def initiate_mpesa_payment(self, phone_number, amount, description):
+        """
+        Send an STK Push for an already-validated phone number
+        Returns: Dict with success/error information ('retryable' marks failures safe to resend,
+        'pending' a push that may already have reached the customer)
+        """
+        try:
+            mpesa = self._get_mpesa_service()
+            return mpesa.initiate_stk_push(
+                phone_number=phone_number,
+                amount=amount,
+                account_reference="FRANKBEAUTY",
+                transaction_desc=description
+            )
+        except Exception as e:
+            logger.error("❌ M-Pesa payment initiation error: %s", e)
+            return {'success': False, 'error': str(e)}
+
     def process_phone_number(self, user_id, phone_text, service_type, amount, platform='telegram'):
         """Process phone number for M-Pesa payment - Optimized validation"""
         try:
@@ -162,7 +180,7 @@ class PaymentHandler:
             self._clear_awaiting_phone(user_id)
             
         except Exception as e:
-            logger.error(f"❌ Error processing phone number: {e}")
+            logger.error("❌ Error processing phone number: %s", e)
             self._send_platform_message(platform, user_id, "❌ Sorry, error processing payment.")
             self._clear_awaiting_phone(user_id)
 
@@ -171,10 +189,10 @@ class PaymentHandler:
         try:
             instructions = self._get_manual_mpesa_instructions(user_id, service_type)
             self._send_platform_message(platform, user_id, instructions)
-            logger.info(f"📋 Manual M-Pesa instructions shown for {service_type}")
+            logger.info("📋 Manual M-Pesa instructions shown for %s", service_type)
             
         except Exception as e:
-            logger.error(f"❌ Error showing manual instructions: {e}")
+            logger.error("❌ Error showing manual instructions: %s", e)
             self._send_platform_message(platform, user_id, "❌ Error loading payment instructions.")
 
     def confirm_cash_payment(self, user_id, service_type, platform='telegram'):
@@ -182,15 +200,15 @@ class PaymentHandler:
         try:
             confirmation = self._get_cash_payment_confirmation(user_id, service_type)
             self._send_platform_message(platform, user_id, confirmation)
-            logger.info(f"💵 Cash payment confirmed for {service_type}")
+            logger.info("💵 Cash payment confirmed for %s", service_type)
             
         except Exception as e:
-            logger.error(f"❌ Cash payment confirmation error: {e}")
+            logger.error("❌ Cash payment confirmation error: %s", e)
 
     def handle_payment_callback(self, callback_data):
         """Handle M-Pesa payment callback - Your existing logic"""
         try:
-            logger.info(f"💰 Processing M-Pesa callback: {callback_data}")
+            logger.info("💰 Processing M-Pesa callback: %s", callback_data)
             
             stk_callback = callback_data.get('Body', {}).get('stkCallback', {})
             callback_metadata = stk_callback.get('CallbackMetadata', {})
@@ -202,7 +220,7 @@ class PaymentHandler:
                 return self._handle_failed_payment(stk_callback)
                 
         except Exception as e:
-            logger.error(f"❌ Payment callback handling error: {e}")
+            logger.error("❌ Payment callback handling error: %s", e)
             return {'status': 'error', 'message': str(e)}
 
     # ==================== HELPER METHODS ====================
@@ -222,7 +240,7 @@ class PaymentHandler:
             return result
             
         except Exception as e:
-            logger.error(f"❌ STK Push initiation error: {e}")
+            logger.error("❌ STK Push initiation error: %s", e)
             return {'success': False, 'error': str(e)}
 
     def _handle_successful_payment_initiation(self, user_id, phone, amount, result, platform):
@@ -232,13 +250,13 @@ class PaymentHandler:
         
         # Store transaction info for verification
         self._store_transaction_details(user_id, phone, amount, result, platform)
-        logger.info(f"✅ STK Push initiated for {phone}")
+        logger.info("✅ STK Push initiated for %s", phone)
 
     def _handle_failed_payment_initiation(self, user_id, result, platform):
         """Handle failed payment initiation"""
         error_message = self._get_payment_failed_message(user_id, result)
         self._send_platform_message(platform, user_id, error_message)
-        logger.error(f"❌ STK Push failed: {result.get('error')}")
+        logger.error("❌ STK Push failed: %s", result.get('error'))
 
     def _handle_successful_payment(self, callback_metadata, stk_callback):
         """Handle successful payment callback"""
@@ -249,7 +267,7 @@ class PaymentHandler:
             mpesa_receipt = transaction_items.get('MpesaReceiptNumber')
             phone_number = transaction_items.get('PhoneNumber')
             
-            logger.info(f"🎉 Payment successful: {mpesa_receipt} - KES {amount} - {phone_number}")
+            logger.info("🎉 Payment successful: %s - KES %s - %s", mpesa_receipt, amount, phone_number)
             
             # Update appointment status
             self._update_appointment_payment(mpesa_receipt, phone_number, amount, 'paid')
@@ -266,14 +284,14 @@ class PaymentHandler:
             }
             
         except Exception as e:
-            logger.error(f"❌ Successful payment handling error: {e}")
+            logger.error("❌ Successful payment handling error: %s", e)
             return {'status': 'error', 'message': str(e)}
 
     def _handle_failed_payment(self, stk_callback):
         """Handle failed payment callback"""
         try:
             result_desc = stk_callback.get('ResultDesc', 'Payment failed')
-            logger.warning(f"❌ Payment failed: {result_desc}")
+            logger.warning("❌ Payment failed: %s", result_desc)
             
             return {
                 'status': 'failed',
@@ -282,7 +300,7 @@ class PaymentHandler:
             }
             
         except Exception as e:
-            logger.error(f"❌ Failed payment handling error: {e}")
+            logger.error("❌ Failed payment handling error: %s", e)
             return {'status': 'error', 'message': str(e)}
 
     def _clean_phone_number(self, phone_text):
@@ -303,7 +321,7 @@ class PaymentHandler:
         elif cleaned.startswith('+254') and len(cleaned) == 13:
             return cleaned[1:]
         else:
-            logger.warning(f"⚠️ Unrecognized phone format: {phone_text}")
+            logger.warning("⚠️ Unrecognized phone format: %s", phone_text)
             return None
 
     def _get_user_language(self, user_id):
@@ -337,7 +355,7 @@ class PaymentHandler:
                 'platform': platform
             })
         except Exception as e:
-            logger.warning(f"Could not set awaiting phone state: {e}")
+            logger.warning("Could not set awaiting phone state: %s", e)
 
     def _clear_awaiting_phone(self, user_id):
         """Clear awaiting phone state"""
@@ -345,7 +363,7 @@ class PaymentHandler:
             from bot.handlers.conversation_states import set_appointment_data
             set_appointment_data(user_id, {'awaiting_phone': False})
         except Exception as e:
-            logger.warning(f"Could not clear awaiting phone state: {e}")
+            logger.warning("Could not clear awaiting phone state: %s", e)
 
     def _send_platform_message(self, platform, user_id, message):
         """Send message to appropriate platform"""
@@ -355,9 +373,9 @@ class PaymentHandler:
                 telegram.send_message(user_id, message)
             elif platform == 'whatsapp':
                 # For async context, this would be handled in async methods
-                logger.info(f"📤 WhatsApp message to {user_id}: {message}")
+                logger.info("📤 WhatsApp message to %s: %s", user_id, message)
         except Exception as e:
-            logger.error(f"❌ Platform message sending error: {e}")
+            logger.error("❌ Platform message sending error: %s", e)
 
     # ==================== LANGUAGE-AWARE MESSAGES ====================
 
@@ -567,20 +585,20 @@ Tom Mboya Street, Nairobi CBD
         """Store transaction details"""
         try:
             checkout_id = result.get('checkout_request_id')
-            logger.info(f"💾 Storing transaction: {checkout_id} - {user_id} - KES {amount}")
+            logger.info("💾 Storing transaction: %s - %s - KES %s", checkout_id, user_id, amount)
         except Exception as e:
-            logger.error(f"❌ Transaction storage error: {e}")
+            logger.error("❌ Transaction storage error: %s", e)
 
     def _update_appointment_payment(self, mpesa_receipt, phone_number, amount, status):
         """Update appointment payment status"""
         try:
-            logger.info(f"📊 Updating appointment payment: {mpesa_receipt} - {status}")
+            logger.info("📊 Updating appointment payment: %s - %s", mpesa_receipt, status)
         except Exception as e:
-            logger.error(f"❌ Appointment payment update error: {e}")
+            logger.error("❌ Appointment payment update error: %s", e)
 
     def _send_payment_confirmation(self, phone_number, amount, mpesa_receipt):
         """Send payment confirmation to user"""
         try:
-            logger.info(f"📨 Payment confirmation sent: {phone_number} - {mpesa_receipt} - KES {amount}")
+            logger.info("📨 Payment confirmation sent: %s - %s - KES %s", phone_number, mpesa_receipt, amount)
         except Exception as e:
-            logger.error(f"❌ Payment confirmation sending error: {e}")
\ No newline at end of file
+            logger.error("❌ Payment confirmation sending error: %s", e)
\ No newline at end of file
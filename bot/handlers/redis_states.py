@@ -0,0 +1,185 @@
+# bot/handlers/redis_states.py
+import os
+import logging
+from bot.utils import fast_json
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    from redis import asyncio as redis_asyncio
+    from redis.exceptions import WatchError
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Idle conversations expire from Redis after this long
+CONVERSATION_TTL_SECONDS = int(os.getenv('CONVERSATION_TTL_SECONDS', '3600'))
+
+# Context keys dropped along with the appointment (mirrors conversation_states)
+_APPOINTMENT_CONTEXT_KEYS = ('last_topic', 'last_service_mentioned', 'last_time_mentioned', 'selected_service')
+
+
+def _loads(raw):
+    return fast_json.loads(raw) if raw else {}
+
+
+class RedisConversationStore:
+    """
+    Conversation state kept in one Redis hash per chat (chat:{id}).
+
+    Same accessors as bot.handlers.conversation_states, but awaited: the
+    client is redis.asyncio, so a slow Redis stalls only the turn waiting on
+    it, never the shared event loop. State survives restarts and is shared by
+    every worker, so no sticky routing is needed; read-merge-writes run under
+    WATCH/MULTI so two workers can't overwrite each other's changes.
+    """
+
+    def __init__(self, client, ttl=CONVERSATION_TTL_SECONDS, idle_state='idle', default_language='english'):
+        self.client = client
+        self.ttl = ttl
+        self.idle_state = idle_state
+        self.default_language = default_language
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Connect using REDIS_URL; returns None when unset or unreachable"""
+        url = os.getenv('REDIS_URL')
+        if not url:
+            return None
+        if not REDIS_AVAILABLE:
+            logger.warning("⚠️ REDIS_URL is set but the redis package is not installed")
+            return None
+        try:
+            # One blocking ping, once per process, decides whether Redis is used at all
+            probe = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+            try:
+                probe.ping()
+            finally:
+                probe.close()
+            client = redis_asyncio.Redis.from_url(url, decode_responses=True, socket_timeout=2)
+        except (redis.exceptions.RedisError, OSError, ValueError) as e:
+            # Unreachable server, refused auth or a malformed URL
+            logger.warning("⚠️ Redis unavailable, keeping conversation state in-process: %s", e)
+            return None
+        logger.info("✅ Conversation state stored in Redis")
+        return cls(client, **kwargs)
+
+    # === Internal helpers ===
+
+    def _key(self, chat_id):
+        return f"chat:{chat_id}"
+
+    async def _write(self, chat_id, fields, drop=()):
+        key = self._key(chat_id)
+        pipe = self.client.pipeline()
+        if drop:
+            pipe.hdel(key, *drop)
+        if fields:
+            pipe.hset(key, mapping=fields)
+        pipe.expire(key, self.ttl)
+        await pipe.execute()
+
+    async def _transact(self, chat_id, reads, build):
+        """
+        Read `reads` fields, then write build(current) -> (fields, drop) atomically.
+
+        WATCH aborts the MULTI if another worker touched the hash in between;
+        the merge is then redone on fresh data.
+        """
+        key = self._key(chat_id)
+        async with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    current = dict(zip(reads, await pipe.hmget(key, reads)))
+                    fields, drop = build(current)
+                    pipe.multi()
+                    if drop:
+                        pipe.hdel(key, *drop)
+                    if fields:
+                        pipe.hset(key, mapping=fields)
+                    pipe.expire(key, self.ttl)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    async def _get_json(self, chat_id, field):
+        return _loads(await self.client.hget(self._key(chat_id), field))
+
+    async def _merge_json(self, chat_id, field, data):
+        def build(current):
+            merged = _loads(current[field])
+            merged.update(data)
+            return {field: fast_json.dumps(merged)}, ()
+        await self._transact(chat_id, (field,), build)
+
+    # === Accessors ===
+
+    async def get_user_state(self, chat_id):
+        return await self.client.hget(self._key(chat_id), 'state') or self.idle_state
+
+    async def set_user_state(self, chat_id, state):
+        await self._write(chat_id, {'state': getattr(state, 'value', state)})
+
+    async def clear_user_state(self, chat_id):
+        await self.client.delete(self._key(chat_id))
+
+    async def get_appointment_data(self, chat_id):
+        return await self._get_json(chat_id, 'appointment')
+
+    async def set_appointment_data(self, chat_id, data):
+        await self._merge_json(chat_id, 'appointment', data)
+
+    async def clear_appointment_data(self, chat_id):
+        await self.update_session(chat_id, clear_appointment=True)
+
+    async def get_conversation_context(self, chat_id):
+        return await self._get_json(chat_id, 'context')
+
+    async def set_conversation_context(self, chat_id, context):
+        await self._merge_json(chat_id, 'context', context)
+
+    async def update_session(self, chat_id, *, state=None, appointment=None, clear_appointment=False, language=None):
+        """
+        Apply one turn's changes in a single write.
+
+        clear_appointment drops the appointment (and its context keys) before
+        `appointment` is merged in. When that needs the stored JSON, the read and
+        write form one WATCH/MULTI transaction; otherwise it's one pipeline.
+        """
+        reads = []
+        if clear_appointment:
+            reads.append('context')
+        elif appointment is not None:
+            reads.append('appointment')
+
+        def build(current):
+            fields = {}
+            if state is not None:
+                fields['state'] = getattr(state, 'value', state)
+            if language is not None:
+                fields['language'] = language
+            if clear_appointment:
+                context = _loads(current['context'])
+                for context_key in _APPOINTMENT_CONTEXT_KEYS:
+                    context.pop(context_key, None)
+                fields['context'] = fast_json.dumps(context)
+            if appointment is not None:
+                merged = _loads(current.get('appointment'))
+                merged.update(appointment)
+                fields['appointment'] = fast_json.dumps(merged)
+            drop = ('appointment',) if clear_appointment and appointment is None else ()
+            return fields, drop
+
+        if reads:
+            await self._transact(chat_id, reads, build)
+        else:
+            await self._write(chat_id, *build({}))
+
+    async def get_user_language(self, chat_id):
+        return await self.client.hget(self._key(chat_id), 'language') or self.default_language
+
+    async def set_user_language(self, chat_id, language):
+        await self._write(chat_id, {'language': language})
@@ -15,16 +15,35 @@ from .conversation_states import (
 
 logger = logging.getLogger(__name__)
 
+# Compiled once for phone validation
+_NON_DIGIT_RE = re.compile(r'\D')
+
+# Whole-message replies accepted at the confirmation step
+_CONFIRM_WORDS = frozenset(('yes', 'ndio', 'y', 'confirm', 'ok'))
+_DECLINE_WORDS = frozenset(('no', 'hapana', 'cancel', 'change'))
+
 class WhatsAppConversationHandler:
     """Handler specifically for WhatsApp conversations"""
     
     def __init__(self, whatsapp_service):
         self.whatsapp = whatsapp_service
+        
+        # Conversation state -> step handler(chat_id, text); unknown states fall back to idle
+        self._state_handlers = {
+            ConversationState.IDLE: self.handle_idle_state,
+            ConversationState.VIEWING_SERVICES: self.handle_viewing_services,
+            ConversationState.AWAITING_SERVICE: self.handle_awaiting_service,
+            ConversationState.AWAITING_DATE: self.handle_awaiting_date,
+            ConversationState.AWAITING_TIME: self.handle_awaiting_time,
+            ConversationState.AWAITING_NAME: self.handle_awaiting_name,
+            ConversationState.AWAITING_PHONE: self.handle_awaiting_phone,
+            ConversationState.AWAITING_CONFIRMATION: self.handle_awaiting_confirmation,
+        }
     
     def process_message(self, chat_id, text):
         """Process WhatsApp message with conversation state"""
         try:
-            logger.info(f"📱 Processing WhatsApp message from {chat_id}: {text}")
+            logger.info("📱 Processing WhatsApp message from %s: %s", chat_id, text)
             
             # Update activity and history
             update_last_activity(chat_id)
@@ -32,7 +51,7 @@ class WhatsAppConversationHandler:
             
             # Get current state
             current_state = get_user_state(chat_id)
-            logger.info(f"Current state for {chat_id}: {current_state}")
+            logger.info("Current state for %s: %s", chat_id, current_state)
             
             # ========== THE FIX ==========
             # Check if user recently viewed services and is now selecting one
@@ -43,35 +62,22 @@ class WhatsAppConversationHandler:
                 # User is selecting a service after seeing the list
                 service = self._extract_service(text)
                 if service:
-                    logger.info(f"🎯 User selecting service after viewing services: {service}")
+                    logger.info("🎯 User selecting service after viewing services: %s", service)
                     track_service_selection(chat_id, service)
                     return self.start_booking_for_service(chat_id, service)
             # ========== END FIX ==========
             
             # Handle based on state
-            if current_state == ConversationState.IDLE:
-                return self.handle_idle_state(chat_id, text)
-            elif current_state == ConversationState.VIEWING_SERVICES:
-                return self.handle_viewing_services(chat_id, text)
-            elif current_state == ConversationState.AWAITING_SERVICE:
-                return self.handle_awaiting_service(chat_id, text)
-            elif current_state == ConversationState.AWAITING_DATE:
-                return self.handle_awaiting_date(chat_id, text)
-            elif current_state == ConversationState.AWAITING_TIME:
-                return self.handle_awaiting_time(chat_id, text)
-            elif current_state == ConversationState.AWAITING_NAME:
-                return self.handle_awaiting_name(chat_id, text)
-            elif current_state == ConversationState.AWAITING_PHONE:
-                return self.handle_awaiting_phone(chat_id, text)
-            elif current_state == ConversationState.AWAITING_CONFIRMATION:
-                return self.handle_awaiting_confirmation(chat_id, text)
-            else:
-                # Default to idle
-                set_user_state(chat_id, ConversationState.IDLE)
-                return self.handle_idle_state(chat_id, text)
+            handler = self._state_handlers.get(current_state)
+            if handler is not None:
+                return handler(chat_id, text)
+            
+            # Default to idle
+            set_user_state(chat_id, ConversationState.IDLE)
+            return self.handle_idle_state(chat_id, text)
                 
         except Exception as e:
-            logger.error(f"Error processing WhatsApp message: {e}")
+            logger.error("Error processing WhatsApp message: %s", e)
             return self.send_error_message(chat_id)
     
     def handle_idle_state(self, chat_id, text):
@@ -234,7 +240,7 @@ class WhatsAppConversationHandler:
         """Handle confirmation step"""
         text_lower = text.lower()
         
-        if text_lower in ['yes', 'ndio', 'y', 'confirm', 'ok']:
+        if text_lower in _CONFIRM_WORDS:
             # Confirm appointment
             appointment = get_appointment_data(chat_id)
             
@@ -248,7 +254,7 @@ class WhatsAppConversationHandler:
                 set_user_state(chat_id, ConversationState.IDLE)
                 return self.send_appointment_error(chat_id)
         
-        elif text_lower in ['no', 'hapana', 'cancel', 'change']:
+        elif text_lower in _DECLINE_WORDS:
             # Cancel booking
             from .conversation_states import clear_user_state
             clear_user_state(chat_id)
@@ -337,8 +343,7 @@ class WhatsAppConversationHandler:
     
     def is_valid_phone(self, text):
         """Validate Kenyan phone number"""
-        import re
-        cleaned = re.sub(r'\D', '', text)
+        cleaned = _NON_DIGIT_RE.sub('', text)
         return (len(cleaned) == 10 and cleaned.startswith('07')) or (len(cleaned) == 12 and cleaned.startswith('254'))
     
     # ========== RESPONSE METHODS ==========
@@ -554,8 +559,8 @@ Reply *YES* to confirm or *NO* to cancel."""
             from bot.models import Appointment, Customer
             from datetime import datetime as dt
             
-            logger.info(f"💾 Saving appointment for {chat_id}")
-            logger.info(f"📝 Appointment data: {appointment}")
+            logger.info("💾 Saving appointment for %s", chat_id)
+            logger.info("📝 Appointment data: %s", appointment)
             
             # 1. Get or create customer
             customer, created = Customer.objects.get_or_create(
@@ -575,7 +580,7 @@ Reply *YES* to confirm or *NO* to cancel."""
                     customer.phone = appointment.get('customer_phone')
                 customer.save()
             
-            logger.info(f"👤 Customer: {customer.name} (ID: {customer.id})")
+            logger.info("👤 Customer: %s (ID: %s)", customer.name, customer.id)
             
             # 2. Parse date and time for scheduled_date
             date_str = appointment.get('date', '')
@@ -635,7 +640,7 @@ Reply *YES* to confirm or *NO* to cancel."""
                     # Default to 2 PM
                     time_obj = dt.strptime('14:00', '%H:%M').time()
             except Exception as e:
-                logger.warning(f"Could not parse time '{time_str}': {e}")
+                logger.warning("Could not parse time '%s': %s", time_str, e)
                 time_obj = dt.strptime('14:00', '%H:%M').time()
             
             # Combine into scheduled_date
@@ -668,15 +673,15 @@ Reply *YES* to confirm or *NO* to cancel."""
                 amount_paid=0.00,
             )
             
-            logger.info(f"✅ Appointment #{appointment_obj.id} saved successfully!")
-            logger.info(f"   Service: {appointment_obj.service_type}")
-            logger.info(f"   Scheduled: {appointment_obj.scheduled_date}")
-            logger.info(f"   Amount: KES {appointment_obj.amount}")
+            logger.info("✅ Appointment #%s saved successfully!", appointment_obj.id)
+            logger.info("   Service: %s", appointment_obj.service_type)
+            logger.info("   Scheduled: %s", appointment_obj.scheduled_date)
+            logger.info("   Amount: KES %s", appointment_obj.amount)
             
             return True
             
         except Exception as e:
-            logger.error(f"❌ Error saving appointment: {e}", exc_info=True)
+            logger.error("❌ Error saving appointment: %s", e, exc_info=True)
             import traceback
             logger.error(traceback.format_exc())
             return False
\ No newline at end of file
@@ -226,7 +226,7 @@ class SalonKnowledge:
             return " ".join(relevant_info)
             
         except Exception as e:
-            logger.error(f"Error getting context for query: {e}")
+            logger.error("Error getting context for query: %s", e)
             return "Frank Beauty Spot - Your trusted beauty salon in Nairobi CBD."
     
     def get_service_details(self, service_name):
@@ -268,7 +268,7 @@ class SalonKnowledge:
                 return hours["open"] <= current_time <= hours["close"]
             return False
         except Exception as e:
-            logger.error(f"Error checking opening hours: {e}")
+            logger.error("Error checking opening hours: %s", e)
             return True  # Default to open if there's an error
     
     def get_next_available_slot(self):
@@ -299,7 +299,7 @@ class SalonKnowledge:
                 return "Tomorrow at 8:00 AM"
                 
         except Exception as e:
-            logger.error(f"Error getting next available slot: {e}")
+            logger.error("Error getting next available slot: %s", e)
             return "Tomorrow at 8:00 AM"
     
     def get_all_services(self):
@@ -1,7 +1,9 @@
 # bot/services/customer_memory.py
 import logging
+import asyncio
 import json
 import os
+import threading
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
@@ -10,6 +12,8 @@ class CustomerMemory:
     def __init__(self, data_dir="data/customers"):
         self.data_dir = data_dir
         os.makedirs(data_dir, exist_ok=True)
+        # Background writers (to_thread) read-modify-write the same customer file
+        self._write_lock = threading.Lock()
         logger.info("CustomerMemory initialized")
     
     def _get_customer_file(self, chat_id):
@@ -25,7 +29,7 @@ class CustomerMemory:
                     return json.load(f)
             return {}
         except Exception as e:
-            logger.error(f"Error reading customer data: {e}")
+            logger.error("Error reading customer data: %s", e)
             return {}
     
     def save_customer_data(self, chat_id, data):
@@ -35,61 +39,102 @@ class CustomerMemory:
             with open(file_path, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
         except Exception as e:
-            logger.error(f"Error saving customer data: {e}")
+            logger.error("Error saving customer data: %s", e)
     
     def remember_customer(self, chat_id):
         """Record or update customer interaction"""
         try:
-            customer_data = self.get_customer_data(chat_id)
-            
-            # Initialize customer data if new
-            if not customer_data:
-                customer_data = {
-                    'chat_id': chat_id,
-                    'first_seen': datetime.now().isoformat(),
-                    'interaction_count': 0,
-                    'last_interaction': datetime.now().isoformat(),
-                    'conversations': [],
-                    'preferences': {
-                        'preferred_services': [],
-                        'payment_methods': []
+            with self._write_lock:
+                customer_data = self.get_customer_data(chat_id)
+            
+                # Initialize customer data if new
+                if not customer_data:
+                    customer_data = {
+                        'chat_id': chat_id,
+                        'first_seen': datetime.now().isoformat(),
+                        'interaction_count': 0,
+                        'last_interaction': datetime.now().isoformat(),
+                        'conversations': [],
+                        'preferences': {
+                            'preferred_services': [],
+                            'payment_methods': []
+                        }
                     }
-                }
             
-            # Update interaction data
-            customer_data['interaction_count'] = customer_data.get('interaction_count', 0) + 1
-            customer_data['last_interaction'] = datetime.now().isoformat()
+                # Update interaction data
+                customer_data['interaction_count'] = customer_data.get('interaction_count', 0) + 1
+                customer_data['last_interaction'] = datetime.now().isoformat()
             
-            self.save_customer_data(chat_id, customer_data)
-            logger.info(f"Remembered customer {chat_id}, interactions: {customer_data['interaction_count']}")
+                self.save_customer_data(chat_id, customer_data)
+                logger.info("Remembered customer %s, interactions: %s", chat_id, customer_data['interaction_count'])
             
         except Exception as e:
-            logger.error(f"Error remembering customer: {e}")
+            logger.error("Error remembering customer: %s", e)
     
     def record_conversation(self, chat_id, user_message, bot_response):
         """Record a conversation exchange"""
         try:
-            customer_data = self.get_customer_data(chat_id)
+            with self._write_lock:
+                customer_data = self.get_customer_data(chat_id)
             
-            if 'conversations' not in customer_data:
-                customer_data['conversations'] = []
+                if 'conversations' not in customer_data:
+                    customer_data['conversations'] = []
             
-            conversation_entry = {
-                'timestamp': datetime.now().isoformat(),
-                'user_message': user_message,
-                'bot_response': bot_response
-            }
+                conversation_entry = {
+                    'timestamp': datetime.now().isoformat(),
+                    'user_message': user_message,
+                    'bot_response': bot_response
+                }
             
-            customer_data['conversations'].append(conversation_entry)
+                customer_data['conversations'].append(conversation_entry)
             
-            # Keep only last 50 conversations to prevent file bloat
-            if len(customer_data['conversations']) > 50:
-                customer_data['conversations'] = customer_data['conversations'][-50:]
+                # Keep only last 50 conversations to prevent file bloat
+                if len(customer_data['conversations']) > 50:
+                    customer_data['conversations'] = customer_data['conversations'][-50:]
             
-            self.save_customer_data(chat_id, customer_data)
+                self.save_customer_data(chat_id, customer_data)
             
         except Exception as e:
-            logger.error(f"Error recording conversation: {e}")
+            logger.error("Error recording conversation: %s", e)
+    
+    def record_appointment(self, chat_id, service, preferred_time, price, status):
+        """Record a booked appointment"""
+        try:
+            with self._write_lock:
+                customer_data = self.get_customer_data(chat_id)
+                
+                if 'appointments' not in customer_data:
+                    customer_data['appointments'] = []
+                
+                customer_data['appointments'].append({
+                    'timestamp': datetime.now().isoformat(),
+                    'service': service,
+                    'preferred_time': preferred_time,
+                    'price': price,
+                    'status': status
+                })
+                
+                # Keep only last 20 appointments to prevent file bloat
+                if len(customer_data['appointments']) > 20:
+                    customer_data['appointments'] = customer_data['appointments'][-20:]
+                
+                self.save_customer_data(chat_id, customer_data)
+            logger.info("Recorded appointment for %s: %s (%s)", chat_id, service, status)
+            
+        except Exception as e:
+            logger.error("Error recording appointment: %s", e)
+    
+    async def remember_customer_async(self, chat_id):
+        """Record customer interaction without blocking the event loop"""
+        await asyncio.to_thread(self.remember_customer, chat_id)
+    
+    async def record_conversation_async(self, chat_id, user_message, bot_response):
+        """Record a conversation exchange without blocking the event loop"""
+        await asyncio.to_thread(self.record_conversation, chat_id, user_message, bot_response)
+    
+    async def record_appointment_async(self, chat_id, service, preferred_time, price, status):
+        """Record a booked appointment without blocking the event loop"""
+        await asyncio.to_thread(self.record_appointment, chat_id, service, preferred_time, price, status)
     
     def get_customer_context(self, chat_id):
         """Get customer context for AI responses"""
@@ -123,7 +168,7 @@ class CustomerMemory:
             return " ".join(context_parts)
             
         except Exception as e:
-            logger.error(f"Error getting customer context: {e}")
+            logger.error("Error getting customer context: %s", e)
             return "Customer context unavailable."
     
     def get_personalized_greeting(self, chat_id):
@@ -148,7 +193,7 @@ class CustomerMemory:
                 return "Welcome back! 😊"
                 
         except Exception as e:
-            logger.error(f"Error getting personalized greeting: {e}")
+            logger.error("Error getting personalized greeting: %s", e)
             return "Hello! 👋"
     
     def get_customer_preferences(self, chat_id):
@@ -157,7 +202,7 @@ class CustomerMemory:
             customer_data = self.get_customer_data(chat_id)
             return customer_data.get('preferences', {})
         except Exception as e:
-            logger.error(f"Error getting customer preferences: {e}")
+            logger.error("Error getting customer preferences: %s", e)
             return {}
     
     def record_service_preference(self, chat_id, service):
@@ -179,10 +224,10 @@ class CustomerMemory:
             
             customer_data['preferences'] = preferences
             self.save_customer_data(chat_id, customer_data)
-            logger.info(f"Recorded service preference for {chat_id}: {service}")
+            logger.info("Recorded service preference for %s: %s", chat_id, service)
             
         except Exception as e:
-            logger.error(f"Error recording service preference: {e}")
+            logger.error("Error recording service preference: %s", e)
     
     def record_payment_preference(self, chat_id, payment_method):
         """Record customer's preferred payment method"""
@@ -198,7 +243,7 @@ class CustomerMemory:
             
             customer_data['preferences'] = preferences
             self.save_customer_data(chat_id, customer_data)
-            logger.info(f"Recorded payment preference for {chat_id}: {payment_method}")
+            logger.info("Recorded payment preference for %s: %s", chat_id, payment_method)
             
         except Exception as e:
-            logger.error(f"Error recording payment preference: {e}")
\ No newline at end of file
+            logger.error("Error recording payment preference: %s", e)
\ No newline at end of file
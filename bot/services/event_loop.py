@@ -0,0 +1,59 @@
+# bot/services/event_loop.py
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """Return the process-wide background event loop, starting it on first use"""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='bot-event-loop', daemon=True).start()
+                _loop = loop
+                logger.info("✅ Shared event loop started")
+    return _loop
+
+
+def run(coro, timeout=None):
+    """
+    Run a coroutine on the shared loop and wait for its result.
+
+    For sync callers (Django views, sync handlers). Must not be called from
+    the loop thread itself - use submit() there.
+    """
+    loop = get_loop()
+    if _on_loop_thread(loop):
+        coro.close()
+        raise RuntimeError("event_loop.run() called from the shared loop; use submit()")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def submit(coro):
+    """Schedule a coroutine on the shared loop without waiting for it"""
+    loop = get_loop()
+    if _on_loop_thread(loop):
+        future = loop.create_task(coro)
+    else:
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def _on_loop_thread(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("❌ Background task failed: %s", future.exception())
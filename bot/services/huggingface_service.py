@@ -26,7 +26,7 @@ class HuggingFaceService:
     
     def generate_enhanced_response(self, user_message, customer_context=None, salon_context=None):
         """Enhanced response generation with context - COMPATIBILITY METHOD"""
-        logger.info(f"Enhanced response called - AI Available: {self.ai_available}")
+        logger.info("Enhanced response called - AI Available: %s", self.ai_available)
         
         # If AI is not available, use intelligent fallback immediately
         if not self.ai_available:
@@ -62,7 +62,7 @@ class HuggingFaceService:
                 }
             }
             
-            logger.info(f"🤖 Sending request to Hugging Face API")
+            logger.info("🤖 Sending request to Hugging Face API")
             response = requests.post(self.api_url, headers=headers, json=payload, timeout=10)
             
             # Handle different response scenarios
@@ -80,7 +80,7 @@ class HuggingFaceService:
             if isinstance(result, list) and len(result) > 0:
                 generated_text = result[0].get('generated_text', '').strip()
                 cleaned_response = self._clean_response(generated_text, user_message)
-                logger.info(f"🤖 AI Response: {cleaned_response}")
+                logger.info("🤖 AI Response: %s", cleaned_response)
                 return cleaned_response
             else:
                 logger.warning("Unexpected API response format")
@@ -90,7 +90,7 @@ class HuggingFaceService:
             logger.error("Hugging Face API timeout")
             return self._get_intelligent_fallback(user_message)
         except Exception as e:
-            logger.error(f"Hugging Face API error: {e}")
+            logger.error("Hugging Face API error: %s", e)
             return self._get_intelligent_fallback(user_message)
     
     def _create_kenyan_prompt(self, user_message):
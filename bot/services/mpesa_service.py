@@ -4,10 +4,19 @@ import requests
 import json
 import base64
 from datetime import datetime, timedelta
+from urllib3.exceptions import NewConnectionError
 from bot.config.mpesa_config import MpesaConfig
 
 logger = logging.getLogger(__name__)
 
+
+def _never_sent(error):
+    """True when a requests ConnectionError failed before the request left (DNS or connect)"""
+    reason = error.args[0] if error.args else None
+    # requests wraps urllib3's error in a MaxRetryError; NameResolutionError is a NewConnectionError
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
 class MpesaService:
     """M-Pesa service for handling payments via Daraja API"""
     
@@ -21,7 +30,7 @@ class MpesaService:
         self.session.trust_env = False
         self.session.proxies.clear()
         
-        logger.info(f"✅ MpesaService initialized - Environment: {MpesaConfig.get_environment()}")
+        logger.info("✅ MpesaService initialized - Environment: %s", MpesaConfig.get_environment())
     
     def _get_access_token(self):
         """Get M-Pesa OAuth access token"""
@@ -55,7 +64,7 @@ class MpesaService:
                 return self.access_token
             else:
                 error_msg = f"Failed to get access token: {response.status_code}"
-                logger.error(f"❌ {error_msg}")
+                logger.error("❌ %s", error_msg)
                 raise Exception(error_msg)
                 
         except requests.exceptions.Timeout:
@@ -65,7 +74,7 @@ class MpesaService:
             logger.error("❌ Cannot connect to M-Pesa servers")
             raise Exception("Check your internet connection")
         except Exception as e:
-            logger.error(f"❌ Error getting M-Pesa token: {e}")
+            logger.error("❌ Error getting M-Pesa token: %s", e)
             raise
     
     def initiate_stk_push(self, phone_number, amount, account_reference, transaction_desc):
@@ -106,7 +115,7 @@ class MpesaService:
                 "TransactionDesc": transaction_desc[:13]
             }
             
-            logger.info(f"🔄 Initiating STK Push for {formatted_phone}, Amount: {amount}")
+            logger.info("🔄 Initiating STK Push for %s, Amount: %s", formatted_phone, amount)
             
             # Make API request
             stk_url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
@@ -115,14 +124,15 @@ class MpesaService:
                 'Content-Type': 'application/json'
             }
             
+            # Short connect timeout: only requests that never reached Daraja are retried
             response = self.session.post(
                 stk_url, 
                 json=payload, 
                 headers=headers,
-                timeout=20
+                timeout=(5, 20)
             )
             
-            logger.info(f"📡 STK Response status: {response.status_code}")
+            logger.info("📡 STK Response status: %s", response.status_code)
             
             if response.status_code == 200:
                 result = response.json()
@@ -139,7 +149,7 @@ class MpesaService:
                     }
                 else:
                     error_msg = result.get('errorMessage', 'STK Push failed')
-                    logger.error(f"❌ STK Push API error: {error_msg}")
+                    logger.error("❌ STK Push API error: %s", error_msg)
                     return {
                         'success': False,
                         'error': error_msg,
@@ -147,29 +157,54 @@ class MpesaService:
                     }
             else:
                 error_msg = f"STK Push HTTP error: {response.status_code}"
-                logger.error(f"❌ {error_msg}")
+                logger.error("❌ %s", error_msg)
                 return {
                     'success': False,
                     'error': error_msg,
-                    'status_code': response.status_code
+                    'status_code': response.status_code,
+                    # An STK Push isn't idempotent: retry only when Daraja turned the request
+                    # away (429/503). Other 5xx may already have prompted the customer.
+                    'retryable': response.status_code in (429, 503),
+                    'pending': response.status_code >= 500 and response.status_code != 503
                 }
                 
-        except requests.exceptions.Timeout:
+        except requests.exceptions.ConnectTimeout:
             error_msg = "M-Pesa servers are not responding"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             return {
                 'success': False,
-                'error': error_msg
+                'error': error_msg,
+                'retryable': True
             }
-        except requests.exceptions.ConnectionError:
-            error_msg = "Cannot connect to M-Pesa servers"
-            logger.error(f"❌ {error_msg}")
+        except requests.exceptions.Timeout:
+            # The request was sent; Daraja has most likely already prompted the customer
+            error_msg = "M-Pesa did not answer in time"
+            logger.error("❌ %s", error_msg)
+            return {
+                'success': False,
+                'error': error_msg,
+                'pending': True
+            }
+        except requests.exceptions.ConnectionError as e:
+            if _never_sent(e):
+                error_msg = "Cannot connect to M-Pesa servers"
+                logger.error("❌ %s", error_msg)
+                return {
+                    'success': False,
+                    'error': error_msg,
+                    'retryable': True
+                }
+            # Dropped after the request went out (RemoteDisconnected, ProtocolError...) -
+            # Daraja may have it, so treat it like a read timeout
+            error_msg = "Lost the connection to M-Pesa mid-request"
+            logger.error("❌ %s: %s", error_msg, e)
             return {
                 'success': False,
-                'error': error_msg
+                'error': error_msg,
+                'pending': True
             }
         except Exception as e:
-            logger.error(f"❌ STK Push error: {e}")
+            logger.error("❌ STK Push error: %s", e)
             return {
                 'success': False,
                 'error': str(e)
@@ -200,7 +235,7 @@ class MpesaService:
             return result
             
         except Exception as e:
-            logger.error(f"❌ Payment initiation error: {e}")
+            logger.error("❌ Payment initiation error: %s", e)
             return {
                 'success': False,
                 'error': str(e)
@@ -248,7 +283,7 @@ class MpesaService:
                 }
                 
         except Exception as e:
-            logger.error(f"❌ Transaction status check error: {e}")
+            logger.error("❌ Transaction status check error: %s", e)
             return {
                 'success': False,
                 'error': str(e)
@@ -272,7 +307,7 @@ class MpesaService:
         elif cleaned.startswith('7') and len(cleaned) == 9:
             return '254' + cleaned
         else:
-            logger.warning(f"⚠️ Unrecognized phone format: {phone_number}")
+            logger.warning("⚠️ Unrecognized phone format: %s", phone_number)
             return None
     
     def validate_phone_number(self, phone_number):
@@ -0,0 +1,169 @@
+# bot/services/outbound_batcher.py
+import os
+import asyncio
+import logging
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+# Flush when this many messages are buffered...
+MAX_BUFFER_SIZE = int(os.getenv('OUTBOUND_MAX_BUFFER_SIZE', '32'))
+# ...or when the oldest buffered message has waited this long (like Kafka's linger.ms)
+MAX_BUFFER_DELAY_MS = int(os.getenv('OUTBOUND_MAX_BUFFER_DELAY_MS', '30'))
+# Global send ceiling across all chats (Telegram's bot API allows ~30 msg/s)
+MAX_SENDS_PER_SEC = float(os.getenv('OUTBOUND_MAX_SENDS_PER_SEC', '30'))
+# Per-chat ceiling; 0 disables it (Telegram wants ~1 msg/s per chat, WhatsApp has no such limit)
+MAX_SENDS_PER_CHAT_PER_SEC = float(os.getenv('OUTBOUND_MAX_SENDS_PER_CHAT_PER_SEC', '0'))
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second, with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _retrieve(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundBatcher:
+    """
+    Buffers outbound messages and sends them in pipelined batches.
+
+    A batch is submitted once MAX_BUFFER_SIZE messages are waiting or
+    MAX_BUFFER_DELAY_MS has passed, whichever comes first. Each chat's share
+    of a batch is chained behind that chat's previous sends, so messages to
+    one chat keep their order while a slow send never holds up other chats.
+    Sends are paced by a global token bucket (and optionally a per-chat
+    interval) so bursts queue up here instead of coming back as HTTP 429s.
+    
+    enqueue() returns a future per message, resolved with send_func's result
+    (False for a rejected send) or its exception, so a caller can wait for
+    just its own messages rather than everything buffered.
+    """
+
+    def __init__(self, send_func, max_buffer_size=MAX_BUFFER_SIZE, max_buffer_delay_ms=MAX_BUFFER_DELAY_MS,
+                 max_sends_per_sec=MAX_SENDS_PER_SEC, max_sends_per_chat_per_sec=MAX_SENDS_PER_CHAT_PER_SEC):
+        self.send_func = send_func
+        self.max_buffer_size = max(1, max_buffer_size)
+        self.max_buffer_delay = max(0, max_buffer_delay_ms) / 1000
+        self._bucket = TokenBucket(max_sends_per_sec) if max_sends_per_sec > 0 else None
+        self._chat_interval = 1 / max_sends_per_chat_per_sec if max_sends_per_chat_per_sec > 0 else 0
+        self._chat_next_send = {}
+        self._chat_tails = {}
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+    def enqueue(self, chat_id, text):
+        """Queue a message for sending - must be called from a running event loop"""
+        self._ensure_worker()
+        sent = self._loop.create_future()
+        # Failures are logged in _send_chat; callers that never await `sent` shouldn't warn again
+        sent.add_done_callback(_retrieve)
+        self._queue.put_nowait((chat_id, text, sent))
+        return sent
+
+    async def flush(self):
+        """Wait until everything queued so far, for every chat, has been sent (e.g. at shutdown)"""
+        if self._queue is not None and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queues are bound to their loop; views may run each turn in a fresh one
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._chat_tails = {}
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_buffer_delay
+
+            while len(batch) < self.max_buffer_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._dispatch(batch, queue)
+
+    def _dispatch(self, batch, queue):
+        """Hand each chat's messages to its send chain; the worker goes straight back to buffering"""
+        loop = asyncio.get_running_loop()
+        if self._chat_next_send:
+            # Forget chats whose per-chat window has already passed
+            now = loop.time()
+            self._chat_next_send = {c: t for c, t in self._chat_next_send.items() if t > now}
+        
+        by_chat = {}
+        for chat_id, text, sent in batch:
+            by_chat.setdefault(chat_id, []).append((text, sent))
+
+        for chat_id, messages in by_chat.items():
+            task = loop.create_task(self._send_chat(chat_id, messages, self._chat_tails.get(chat_id), queue))
+            self._chat_tails[chat_id] = task
+            task.add_done_callback(partial(self._forget_tail, chat_id))
+
+    def _forget_tail(self, chat_id, task):
+        if self._chat_tails.get(chat_id) is task:
+            del self._chat_tails[chat_id]
+
+    async def _send_chat(self, chat_id, messages, previous, queue):
+        try:
+            if previous is not None:
+                # This chat's earlier batch goes first
+                await asyncio.wait((previous,))
+            await self._send_in_order(chat_id, messages)
+        finally:
+            for _ in messages:
+                queue.task_done()
+
+    async def _send_in_order(self, chat_id, messages):
+        loop = asyncio.get_running_loop()
+        for text, sent in messages:
+            try:
+                if self._chat_interval:
+                    wait = self._chat_next_send.get(chat_id, 0) - loop.time()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self._chat_next_send[chat_id] = loop.time() + self._chat_interval
+                if self._bucket is not None:
+                    await self._bucket.acquire()
+                result = await self.send_func(chat_id, text)
+            except Exception as e:
+                logger.error("❌ Batched send to %s failed: %s", chat_id, e)
+                if not sent.done():
+                    sent.set_exception(e)
+            else:
+                if result is False:
+                    logger.error("❌ Batched send to %s was rejected", chat_id)
+                if not sent.done():
+                    sent.set_result(result)
@@ -1,9 +1,11 @@
 # bot/services/telegram_service.py
 import os
+import asyncio
 import requests
 import json
 import logging
 from urllib.parse import urlencode
+from bot.utils import fast_json
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +34,10 @@ class TelegramService(BaseMessageService):
         """Create requests session with proper configuration"""
         session = requests.Session()
         
+        # Keep-alive pool sized for concurrent send_message_async calls (each runs in
+        # its own worker thread); the default of 10 would drop extra connections
+        session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=32))
+        
         # Configure headers
         session.headers.update({
             'Content-Type': 'application/json',
@@ -45,7 +51,7 @@ class TelegramService(BaseMessageService):
                 'http': proxy_url,
                 'https': proxy_url
             }
-            logger.info(f"🔧 Using proxy: {proxy_url}")
+            logger.info("🔧 Using proxy: %s", proxy_url)
         
         return session
     
@@ -66,10 +72,10 @@ class TelegramService(BaseMessageService):
             response = self.session.get(url, params=params, timeout=timeout + 5)
             response.raise_for_status()
             
-            data = response.json()
+            data = fast_json.loads(response.content)
             
             if not data.get('ok'):
-                logger.error(f"Telegram API error: {data.get('description')}")
+                logger.error("Telegram API error: %s", data.get('description'))
                 return None
                 
             return data
@@ -78,13 +84,13 @@ class TelegramService(BaseMessageService):
             logger.debug("Polling timeout - no new updates")
             return {'ok': True, 'result': []}
         except requests.exceptions.ConnectionError as e:
-            logger.error(f"Connection error getting updates: {e}")
+            logger.error("Connection error getting updates: %s", e)
             return None
         except requests.exceptions.RequestException as e:
-            logger.error(f"Request error getting updates: {e}")
+            logger.error("Request error getting updates: %s", e)
             return None
         except Exception as e:
-            logger.error(f"Unexpected error getting updates: {e}")
+            logger.error("Unexpected error getting updates: %s", e)
             return None
     
     def send_message(self, chat_id, text, parse_mode='Markdown', reply_markup=None):
@@ -107,19 +113,25 @@ class TelegramService(BaseMessageService):
             
             result = response.json()
             if result.get('ok'):
-                logger.info(f"✅ Message sent to {chat_id}")
+                logger.info("✅ Message sent to %s", chat_id)
                 return result
             else:
-                logger.error(f"❌ Failed to send message: {result.get('description')}")
+                logger.error("❌ Failed to send message: %s", result.get('description'))
                 return None
                 
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Error sending message: {e}")
+            logger.error("❌ Error sending message: %s", e)
             return None
         except Exception as e:
-            logger.error(f"❌ Unexpected error sending message: {e}")
+            logger.error("❌ Unexpected error sending message: %s", e)
             return None
     
+    async def send_message_async(self, chat_id, text, parse_mode='Markdown', reply_markup=None):
+        """
+        Send message without blocking the event loop
+        """
+        return await asyncio.to_thread(self.send_message, chat_id, text, parse_mode, reply_markup)
+    
     def send_message_with_buttons(self, chat_id, text, buttons, parse_mode='Markdown'):
         """
         Send message with inline keyboard buttons
@@ -136,7 +148,7 @@ class TelegramService(BaseMessageService):
                 reply_markup=keyboard
             )
         except Exception as e:
-            logger.error(f"❌ Error sending message with buttons: {e}")
+            logger.error("❌ Error sending message with buttons: %s", e)
             return None
     
     def answer_callback_query(self, callback_query_id, text=None, show_alert=False):
@@ -160,7 +172,7 @@ class TelegramService(BaseMessageService):
             return response.json()
             
         except Exception as e:
-            logger.error(f"❌ Error answering callback query: {e}")
+            logger.error("❌ Error answering callback query: %s", e)
             return None
     
     def delete_message(self, chat_id, message_id):
@@ -180,7 +192,7 @@ class TelegramService(BaseMessageService):
             return response.json()
             
         except Exception as e:
-            logger.error(f"❌ Error deleting message: {e}")
+            logger.error("❌ Error deleting message: %s", e)
             return None
     
     def edit_message_text(self, chat_id, message_id, text, parse_mode='Markdown', reply_markup=None):
@@ -205,7 +217,7 @@ class TelegramService(BaseMessageService):
             return response.json()
             
         except Exception as e:
-            logger.error(f"❌ Error editing message: {e}")
+            logger.error("❌ Error editing message: %s", e)
             return None
     
     def set_webhook(self, webhook_url):
@@ -223,11 +235,11 @@ class TelegramService(BaseMessageService):
             response.raise_for_status()
             
             result = response.json()
-            logger.info(f"✅ Webhook set: {result}")
+            logger.info("✅ Webhook set: %s", result)
             return result
             
         except Exception as e:
-            logger.error(f"❌ Error setting webhook: {e}")
+            logger.error("❌ Error setting webhook: %s", e)
             return None
     
     def delete_webhook(self):
@@ -244,7 +256,7 @@ class TelegramService(BaseMessageService):
             return result
             
         except Exception as e:
-            logger.error(f"❌ Error deleting webhook: {e}")
+            logger.error("❌ Error deleting webhook: %s", e)
             return None
     
     def get_me(self):
@@ -259,12 +271,12 @@ class TelegramService(BaseMessageService):
             result = response.json()
             if result.get('ok'):
                 bot_info = result['result']
-                logger.info(f"🤖 Bot info: {bot_info.get('first_name')} (@{bot_info.get('username')})")
+                logger.info("🤖 Bot info: %s (@%s)", bot_info.get('first_name'), bot_info.get('username'))
                 return bot_info
             return None
             
         except Exception as e:
-            logger.error(f"❌ Error getting bot info: {e}")
+            logger.error("❌ Error getting bot info: %s", e)
             return None
     
     def test_connection(self):
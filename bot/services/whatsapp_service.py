@@ -1,5 +1,6 @@
 # bot/services/whatsapp_service.py
 import logging
+import asyncio
 import requests
 import json
 import os
@@ -16,11 +17,16 @@ class WhatsAppService:
         self.api_version = "v24.0"
         self.base_url = f"https://graph.facebook.com/{self.api_version}"
         
+        # One pooled session so sends reuse keep-alive TLS connections to the Graph API;
+        # the pool is sized for the outbound batcher's concurrent to_thread sends
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=32))
+        
         # Validate configuration
         if self.access_token == 'YOUR_ACCESS_TOKEN_HERE':
             logger.warning("⚠️ WhatsApp access token not configured. Set WHATSAPP_ACCESS_TOKEN environment variable.")
         
-        logger.info(f"📱 WhatsApp Service initialized for phone number ID: {self.phone_number_id}")
+        logger.info("📱 WhatsApp Service initialized for phone number ID: %s", self.phone_number_id)
 
     def send_message(self, to_number: str, message_text: str) -> bool:
         """Send WhatsApp message using the Graph API"""
@@ -29,7 +35,7 @@ class WhatsAppService:
             formatted_number = self._format_phone_number(to_number)
             
             if not formatted_number:
-                logger.error(f"❌ Invalid phone number format: {to_number}")
+                logger.error("❌ Invalid phone number format: %s", to_number)
                 return False
             
             url = f"{self.base_url}/{self.phone_number_id}/messages"
@@ -51,11 +57,12 @@ class WhatsAppService:
                 "Accept": "application/json"
             }
             
-            logger.info(f"📤 Sending WhatsApp message to {formatted_number}: {message_text[:50]}...")
-            logger.debug(f"🔧 Using URL: {url}")
-            logger.debug(f"🔧 Payload: {json.dumps(payload, indent=2)}")
+            logger.info("📤 Sending WhatsApp message to %s: %s...", formatted_number, message_text[:50])
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔧 Using URL: %s", url)
+                logger.debug("🔧 Payload: %s", json.dumps(payload, indent=2))
             
-            response = requests.post(
+            response = self.session.post(
                 url, 
                 json=payload, 
                 headers=headers, 
@@ -63,12 +70,12 @@ class WhatsAppService:
             )
             
             if response.status_code == 200:
-                response_data = response.json()
-                logger.info(f"✅ WhatsApp message sent successfully to {formatted_number}")
-                logger.debug(f"📄 Response: {json.dumps(response_data, indent=2)}")
+                logger.info("✅ WhatsApp message sent successfully to %s", formatted_number)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("📄 Response: %s", json.dumps(response.json(), indent=2))
                 return True
             else:
-                logger.error(f"❌ Error sending WhatsApp message to {formatted_number}: {response.status_code} {response.reason}")
+                logger.error("❌ Error sending WhatsApp message to %s: %s %s", formatted_number, response.status_code, response.reason)
                 
                 # Detailed error logging
                 try:
@@ -82,7 +89,7 @@ class WhatsAppService:
                             'error_subcode': error_msg.get('error_subcode', 'None'),
                             'fbtrace_id': error_msg.get('fbtrace_id', 'None')
                         }
-                        logger.error(f"🔍 Error details: {error_details}")
+                        logger.error("🔍 Error details: %s", error_details)
                         
                         # Specific handling for common errors
                         if error_msg.get('code') == 100:
@@ -93,21 +100,25 @@ class WhatsAppService:
                             logger.error("🔧 Possible solutions: Phone Number ID doesn't exist or permissions missing")
                             
                 except Exception as parse_error:
-                    logger.error(f"📄 Raw response content: {response.text}")
-                    logger.error(f"🔍 Could not parse error response: {parse_error}")
+                    logger.error("📄 Raw response content: %s", response.text)
+                    logger.error("🔍 Could not parse error response: %s", parse_error)
                     
                 return False
                 
         except requests.exceptions.Timeout:
-            logger.error(f"⏰ Timeout sending WhatsApp message to {to_number}")
+            logger.error("⏰ Timeout sending WhatsApp message to %s", to_number)
             return False
         except requests.exceptions.ConnectionError:
-            logger.error(f"🔌 Connection error sending WhatsApp message to {to_number}")
+            logger.error("🔌 Connection error sending WhatsApp message to %s", to_number)
             return False
         except Exception as e:
-            logger.error(f"❌ Exception sending WhatsApp message to {to_number}: {str(e)}")
+            logger.error("❌ Exception sending WhatsApp message to %s: %s", to_number, str(e))
             return False
 
+    async def send_message_async(self, to_number: str, message_text: str) -> bool:
+        """Send WhatsApp message without blocking the event loop"""
+        return await asyncio.to_thread(self.send_message, to_number, message_text)
+
     def _format_phone_number(self, phone_number: str) -> Optional[str]:
         """Format phone number to international format (254XXXXXXXXX)"""
         try:
@@ -128,11 +139,11 @@ class WhatsAppService:
                 # Convert +254... to 254...
                 return cleaned[1:]
             else:
-                logger.warning(f"⚠️ Unrecognized phone number format: {phone_number} (cleaned: {cleaned})")
+                logger.warning("⚠️ Unrecognized phone number format: %s (cleaned: %s)", phone_number, cleaned)
                 return None
                 
         except Exception as e:
-            logger.error(f"❌ Error formatting phone number {phone_number}: {e}")
+            logger.error("❌ Error formatting phone number %s: %s", phone_number, e)
             return None
 
     async def send_quick_reply(self, to_number: str, message_text: str, quick_replies: List[str]) -> bool:
@@ -176,28 +187,28 @@ class WhatsAppService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = self.session.post(url, json=payload, headers=headers, timeout=30)
             
             if response.status_code == 200:
-                logger.info(f"✅ WhatsApp quick reply sent to {formatted_number}")
+                logger.info("✅ WhatsApp quick reply sent to %s", formatted_number)
                 return True
             else:
-                logger.error(f"❌ Error sending WhatsApp quick reply: {response.status_code} - {response.text}")
+                logger.error("❌ Error sending WhatsApp quick reply: %s - %s", response.status_code, response.text)
                 return False
             
         except Exception as e:
-            logger.error(f"❌ Exception sending WhatsApp quick reply: {e}")
+            logger.error("❌ Exception sending WhatsApp quick reply: %s", e)
             return False
 
     def verify_webhook(self, hub_mode: str, hub_verify_token: str, hub_challenge: str) -> Optional[str]:
         """Verify WhatsApp webhook"""
-        logger.info(f"🔐 Webhook verification attempt: mode={hub_mode}, token={hub_verify_token}")
+        logger.info("🔐 Webhook verification attempt: mode=%s, token=%s", hub_mode, hub_verify_token)
         
         if hub_mode == "subscribe" and hub_verify_token == self.verify_token:
             logger.info("✅ Webhook verified successfully")
             return hub_challenge
         else:
-            logger.error(f"❌ Webhook verification failed. Expected token: {self.verify_token}, Got: {hub_verify_token}")
+            logger.error("❌ Webhook verification failed. Expected token: %s, Got: %s", self.verify_token, hub_verify_token)
             return None
 
     def mark_message_as_read(self, message_id: str) -> bool:
@@ -216,11 +227,11 @@ class WhatsAppService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=10)
+            response = self.session.post(url, json=payload, headers=headers, timeout=10)
             return response.status_code == 200
             
         except Exception as e:
-            logger.error(f"Error marking message as read: {e}")
+            logger.error("Error marking message as read: %s", e)
             return False
 
     async def send_template_message(self, to_number: str, template_name: str, parameters: List[Dict] = None) -> bool:
@@ -255,9 +266,9 @@ class WhatsAppService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = self.session.post(url, json=payload, headers=headers, timeout=30)
             return response.status_code == 200
             
         except Exception as e:
-            logger.error(f"Error sending template message: {e}")
+            logger.error("Error sending template message: %s", e)
             return False
\ No newline at end of file
@@ -1,3 +1,522 @@
-from django.test import TestCase
+import asyncio
+import os
+import socket
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from redis.exceptions import ConnectionError as RedisConnectionError, WatchError
+
+from bot.handlers import conversation_states, message_handler as mh
+from bot.handlers.redis_states import RedisConversationStore
+from bot.services.mpesa_service import MpesaService
+from bot.services.outbound_batcher import OutboundBatcher
+
+
+async def _stop(task):
+    """Cancel a long-lived worker so it doesn't outlive the test's event loop"""
+    if task is not None and not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+class RecordingSender:
+    """send_func stand-in: records (chat_id, text) and can hold one chat's sends"""
+
+    def __init__(self, blocked_chat=None):
+        self.sent = []
+        self.blocked_chat = blocked_chat
+        self.release = asyncio.Event()
+
+    async def __call__(self, chat_id, text):
+        if chat_id == self.blocked_chat:
+            await self.release.wait()
+        await asyncio.sleep(0)
+        self.sent.append((chat_id, text))
+        return True
+
+
+class OutboundBatcherTests(SimpleTestCase):
+
+    async def test_full_buffer_is_sent_without_waiting_for_linger(self):
+        sender = RecordingSender()
+        batcher = OutboundBatcher(sender, max_buffer_size=3, max_buffer_delay_ms=10_000, max_sends_per_sec=0)
+        sends = [batcher.enqueue('254700000001', str(i)) for i in range(3)]
+
+        results = await asyncio.wait_for(asyncio.gather(*sends), 1)
+
+        self.assertEqual(results, [True, True, True])
+        await _stop(batcher._worker)
+
+    async def test_partial_buffer_is_sent_after_linger(self):
+        sender = RecordingSender()
+        batcher = OutboundBatcher(sender, max_buffer_size=100, max_buffer_delay_ms=20, max_sends_per_sec=0)
+        sent = batcher.enqueue('254700000001', 'hi')
+
+        await asyncio.sleep(0.005)
+        self.assertEqual(sender.sent, [])
+        self.assertTrue(await asyncio.wait_for(sent, 1))
+        self.assertEqual(sender.sent, [('254700000001', 'hi')])
+        await _stop(batcher._worker)
+
+    async def test_messages_to_one_chat_keep_their_order(self):
+        sender = RecordingSender()
+        batcher = OutboundBatcher(sender, max_buffer_size=4, max_buffer_delay_ms=5, max_sends_per_sec=0)
+        sends = [batcher.enqueue(chat_id, f"{chat_id}-{i}") for i in range(6) for chat_id in ('a', 'b')]
+
+        await asyncio.wait_for(asyncio.gather(*sends), 1)
+
+        for chat_id in ('a', 'b'):
+            texts = [text for chat, text in sender.sent if chat == chat_id]
+            self.assertEqual(texts, [f"{chat_id}-{i}" for i in range(6)])
+        await _stop(batcher._worker)
+
+    async def test_slow_send_does_not_hold_up_another_chats_later_batch(self):
+        sender = RecordingSender(blocked_chat='a')
+        batcher = OutboundBatcher(sender, max_buffer_size=100, max_buffer_delay_ms=10, max_sends_per_sec=0)
+        slow = batcher.enqueue('a', 'a-1')
+        await asyncio.sleep(0.03)  # a-1's batch has gone out and is stuck in send_func
+
+        later = batcher.enqueue('b', 'b-1')
+
+        self.assertTrue(await asyncio.wait_for(later, 1))
+        self.assertFalse(slow.done())
+        sender.release.set()
+        self.assertTrue(await asyncio.wait_for(slow, 1))
+        await _stop(batcher._worker)
+
+    async def test_chat_order_holds_across_batches(self):
+        sender = RecordingSender(blocked_chat='a')
+        batcher = OutboundBatcher(sender, max_buffer_size=100, max_buffer_delay_ms=10, max_sends_per_sec=0)
+        first = batcher.enqueue('a', 'a-1')
+        await asyncio.sleep(0.03)
+        second = batcher.enqueue('a', 'a-2')
+        await asyncio.sleep(0.03)  # a-2's batch is out too, queued behind a-1
+
+        self.assertFalse(second.done())
+        sender.release.set()
+        await asyncio.wait_for(asyncio.gather(first, second), 1)
+        self.assertEqual(sender.sent, [('a', 'a-1'), ('a', 'a-2')])
+        await _stop(batcher._worker)
+
+    async def test_failed_and_rejected_sends_resolve_their_futures(self):
+        async def send(chat_id, text):
+            if text == 'boom':
+                raise ConnectionError('down')
+            return text != 'rejected'
+
+        batcher = OutboundBatcher(send, max_buffer_delay_ms=1, max_sends_per_sec=0)
+        failed = batcher.enqueue('a', 'boom')
+        rejected = batcher.enqueue('a', 'rejected')
+        delivered = batcher.enqueue('a', 'ok')
+
+        with self.assertRaises(ConnectionError):
+            await asyncio.wait_for(failed, 1)
+        self.assertIs(await rejected, False)
+        self.assertIs(await delivered, True)
+        await _stop(batcher._worker)
+
+    async def test_turn_waits_only_for_its_own_replies(self):
+        sender = RecordingSender(blocked_chat='254799999999')
+        handler = mh.MessageHandler()
+        handler.whatsapp_batcher = OutboundBatcher(sender, max_buffer_delay_ms=1, max_sends_per_sec=0)
+
+        # Another chat's reply is stuck; this chat's turn must still finish
+        await handler.send_whatsapp_response('254799999999', 'stuck')
+        handler._turn_sends['254700000001'] = turn_sends = []
+        await handler.send_whatsapp_response('254700000001', 'hello')
+
+        await asyncio.wait_for(handler._await_delivery('254700000001', turn_sends), 1)
+        self.assertIn(('254700000001', 'hello'), sender.sent)
+        self.assertEqual(len(turn_sends), 1)
+
+        flush = asyncio.ensure_future(handler.whatsapp_batcher.flush())
+        await asyncio.sleep(0.05)
+        self.assertFalse(flush.done())
+
+        sender.release.set()
+        await asyncio.wait_for(flush, 1)
+        await _stop(handler.whatsapp_batcher._worker)
+
+
+class ChatOrderTests(SimpleTestCase):
+
+    async def test_messages_from_one_chat_run_in_arrival_order(self):
+        handler = mh.MessageHandler()
+        seen = []
+
+        async def step(i):
+            await asyncio.sleep(0.01 * (5 - i))  # later messages would finish first if run concurrently
+            seen.append(i)
+            return i
+
+        results = await asyncio.gather(*(handler._run_in_chat_order('254700000001', step, i) for i in range(5)))
+
+        self.assertEqual(seen, [0, 1, 2, 3, 4])
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+        for worker in list(handler._chat_workers.values()):
+            await _stop(worker)
+
+    async def test_messages_beyond_the_backlog_are_dropped(self):
+        handler = mh.MessageHandler()
+        started, release = asyncio.Event(), asyncio.Event()
+        ran = []
+
+        async def step(i):
+            ran.append(i)
+            started.set()
+            await release.wait()
+            return i
+
+        with mock.patch.object(mh, 'MAX_PENDING_PER_CHAT', 1):
+            first = asyncio.ensure_future(handler._run_in_chat_order('254700000001', step, 0))
+            await started.wait()
+            queued = asyncio.ensure_future(handler._run_in_chat_order('254700000001', step, 1))
+            await asyncio.sleep(0)
+            dropped = await handler._run_in_chat_order('254700000001', step, 2)
+
+        self.assertIsNone(dropped)
+        release.set()
+        self.assertEqual(await asyncio.gather(first, queued), [0, 1])
+        self.assertEqual(ran, [0, 1])
+        for worker in list(handler._chat_workers.values()):
+            await _stop(worker)
+
+
+class ClassifyIntentTests(SimpleTestCase):
+
+    def assertIntent(self, intent, *messages):
+        for message in messages:
+            with self.subTest(message=message):
+                self.assertEqual(mh._classify_intent(message), intent)
+
+    def test_greetings(self):
+        self.assertIntent('greeting', 'hello', 'hello!', 'habari, mambo?', 'good morning')
+
+    def test_pricing_words_and_phrases(self):
+        self.assertIntent('pricing', 'bei?', 'what are your prices.', 'how much is a facial')
+
+    def test_thanks(self):
+        self.assertIntent('thanks', 'thanks!!', 'asante sana', 'thank you')
+
+    def test_keywords_match_whole_words_only(self):
+        # 'hi' in 'this', 'price' in 'pricey' and 'thank' in 'thankful' are not keywords
+        self.assertIntent('fallback', 'this', 'hiking this weekend', 'pricey', 'thankful')
+
+
+class AppointmentKeywordTests(SimpleTestCase):
+
+    def test_keywords_and_their_inflections_match(self):
+        for text in ('book', 'booked', 'booking', 'appointments', 'visiting',
+                     'rebook', 'rescheduled', 'nataka kuweka', 'is she free tomorrow?'):
+            with self.subTest(text=text):
+                self.assertTrue(mh._has_appointment_keyword(text))
+
+    def test_keywords_inside_other_words_do_not_match(self):
+        for text in ('facebook', 'freebie', 'needle', 'hi want', 'bookworm'):
+            with self.subTest(text=text):
+                self.assertFalse(mh._has_appointment_keyword(text))
+
+
+class LanguageSelectionTests(SimpleTestCase):
+
+    async def choose(self, text):
+        handler = mh.MessageHandler()
+        states = handler._get_conversation_states()
+        chat_id = '254700000002'
+        try:
+            reply = await handler._handle_language_selection_response(chat_id, text, 'english')
+            return reply, await states.get_user_language(chat_id)
+        finally:
+            await states.clear_user_state(chat_id)
+
+    async def test_first_cue_in_the_message_wins(self):
+        for text, language in (('English not sheng', 'english'),
+                               ('sheng, not english', 'sheng'),
+                               ('formal swahili please', 'english'),
+                               ('informal english', 'sheng')):
+            with self.subTest(text=text):
+                reply, stored = await self.choose(text)
+                self.assertEqual(stored, language)
+                self.assertEqual(reply, mh._LANGUAGE_CHOICE_REPLIES[language])
+
+    async def test_longer_word_is_preferred_over_the_word_it_contains(self):
+        # 'swenglish' contains 'english', 'informal' contains 'formal'
+        self.assertEqual((await self.choose('swenglish'))[1], 'swenglish')
+        self.assertEqual((await self.choose('informal'))[1], 'sheng')
+
+    async def test_no_cue_asks_again(self):
+        reply, _ = await self.choose('french please')
+        self.assertEqual(reply, 'Please choose: Sheng, Swenglish, or English')
+
+
+class BookingFlowTests(SimpleTestCase):
+
+    async def test_booking_with_a_clear_service_records_it_and_asks_for_a_time(self):
+        sender = RecordingSender()
+        handler = mh.MessageHandler()
+        handler.whatsapp_batcher = OutboundBatcher(sender, max_buffer_delay_ms=1, max_sends_per_sec=0)
+        states = handler._get_conversation_states()
+        chat_id = '254700000003'
+        try:
+            await handler._start_booking_whatsapp(chat_id, 'book a haircut', 'english')
+            await asyncio.wait_for(handler.whatsapp_batcher.flush(), 1)
+
+            self.assertEqual(await states.get_user_state(chat_id), mh.ConversationState.AWAITING_TIME)
+            appointment = await states.get_appointment_data(chat_id)
+            self.assertEqual(appointment['service'], 'hair')
+            self.assertEqual(appointment['price'], 800)
+            self.assertEqual(sender.sent, [(chat_id, handler.get_response(
+                chat_id, 'time_question', language='english', service='Hair'))])
+        finally:
+            await states.clear_user_state(chat_id)
+        await _stop(handler.whatsapp_batcher._worker)
+
+
+class RetryTransientTests(SimpleTestCase):
+
+    def _calls(self, *outcomes):
+        outcomes = list(outcomes)
+        calls = []
+
+        def call(*args):
+            calls.append(args)
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        return call, calls
+
+    async def test_retryable_result_is_retried(self):
+        call, calls = self._calls({'success': False, 'retryable': True}, {'success': True})
+        result = await mh._retry_transient(call, '254700000001', base=0)
+        self.assertEqual(result, {'success': True})
+        self.assertEqual(len(calls), 2)
+
+    async def test_permanent_and_pending_results_are_not_retried(self):
+        for outcome in ({'success': False}, {'success': False, 'pending': True}):
+            call, calls = self._calls(outcome)
+            self.assertEqual(await mh._retry_transient(call, base=0), outcome)
+            self.assertEqual(len(calls), 1)
+
+    async def test_network_errors_are_retried_until_the_last_attempt(self):
+        call, calls = self._calls(ConnectionError(), {'success': True})
+        self.assertEqual(await mh._retry_transient(call, base=0), {'success': True})
+
+        call, calls = self._calls(*[ConnectionError()] * 3)
+        with self.assertRaises(ConnectionError):
+            await mh._retry_transient(call, attempts=3, base=0)
+        self.assertEqual(len(calls), 3)
+
+    async def test_other_errors_are_raised_at_once(self):
+        call, calls = self._calls(ValueError('bad amount'))
+        with self.assertRaises(ValueError):
+            await mh._retry_transient(call, base=0)
+        self.assertEqual(len(calls), 1)
+
+
+class FakeRedis:
+    """In-memory async Redis: hashes plus redis-py pipeline semantics (WATCH, then buffered MULTI)"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.versions = {}
+
+    def _bump(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    async def delete(self, key):
+        self.hashes.pop(key, None)
+        self._bump(key)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+
+    def __init__(self, client):
+        self.client = client
+        self.reset()
+
+    def reset(self):
+        self.commands = []
+        self.watched = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.reset()
+
+    async def watch(self, key):
+        self.watched = (key, self.client.versions.get(key, 0))
+
+    async def hmget(self, key, fields):
+        await asyncio.sleep(0)  # lets a concurrent turn read the same hash first
+        data = self.client.hashes.get(key, {})
+        return [data.get(field) for field in fields]
+
+    def multi(self):
+        pass
+
+    def hset(self, key, mapping):
+        def run():
+            self.client.hashes.setdefault(key, {}).update(mapping)
+            self.client._bump(key)
+        self.commands.append(run)
+        return self
+
+    def hdel(self, key, *fields):
+        def run():
+            for field in fields:
+                self.client.hashes.get(key, {}).pop(field, None)
+            self.client._bump(key)
+        self.commands.append(run)
+        return self
+
+    def expire(self, key, ttl):
+        return self
+
+    async def execute(self):
+        try:
+            if self.watched and self.client.versions.get(self.watched[0], 0) != self.watched[1]:
+                raise WatchError("watched key changed")
+            for command in self.commands:
+                command()
+        finally:
+            self.reset()
+
+
+class RedisConversationStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = FakeRedis()
+        self.store = RedisConversationStore(self.client, idle_state='idle', default_language='swenglish')
+
+    async def test_defaults_and_round_trip(self):
+        self.assertEqual(await self.store.get_user_state('1'), 'idle')
+        self.assertEqual(await self.store.get_user_language('1'), 'swenglish')
+        self.assertEqual(await self.store.get_appointment_data('1'), {})
+
+        await self.store.set_user_state('1', 'awaiting_time')
+        await self.store.set_user_language('1', 'sheng')
+        self.assertEqual(await self.store.get_user_state('1'), 'awaiting_time')
+        self.assertEqual(await self.store.get_user_language('1'), 'sheng')
+
+        await self.store.clear_user_state('1')
+        self.assertEqual(await self.store.get_user_state('1'), 'idle')
+
+    async def test_concurrent_merges_keep_both_changes(self):
+        await asyncio.gather(
+            self.store.set_appointment_data('1', {'service': 'hair'}),
+            self.store.update_session('1', state='awaiting_confirmation', appointment={'preferred_time': '2pm'}),
+        )
+
+        self.assertEqual(await self.store.get_appointment_data('1'), {'service': 'hair', 'preferred_time': '2pm'})
+        self.assertEqual(await self.store.get_user_state('1'), 'awaiting_confirmation')
+
+    async def test_clearing_the_appointment_drops_its_context(self):
+        await self.store.set_appointment_data('1', {'service': 'hair'})
+        await self.store.set_conversation_context('1', {'last_service_mentioned': 'hair', 'greeted': True})
+
+        await self.store.update_session('1', state='idle', clear_appointment=True, language='english')
+
+        self.assertEqual(await self.store.get_appointment_data('1'), {})
+        self.assertEqual(await self.store.get_conversation_context('1'), {'greeted': True})
+        self.assertEqual(await self.store.get_user_state('1'), 'idle')
+        self.assertEqual(await self.store.get_user_language('1'), 'english')
+
+    async def test_clear_then_merge_replaces_the_appointment(self):
+        await self.store.set_appointment_data('1', {'service': 'hair', 'price': 800})
+
+        await self.store.update_session('1', clear_appointment=True, appointment={'service': 'nails'})
+
+        self.assertEqual(await self.store.get_appointment_data('1'), {'service': 'nails'})
+
+
+class RedisFallbackTests(SimpleTestCase):
+
+    @mock.patch.dict(os.environ, {'REDIS_URL': 'redis://redis.invalid:6379/0'})
+    @mock.patch('redis.Redis.from_url')
+    async def test_failed_ping_falls_back_to_in_process_state(self, from_url):
+        from_url.return_value.ping.side_effect = RedisConnectionError('Connection refused')
+
+        with self.assertLogs('bot.handlers.redis_states', 'WARNING'):
+            self.assertIsNone(RedisConversationStore.from_env(idle_state='idle'))
+        from_url.return_value.close.assert_called_once()
+
+        with self.assertLogs('bot.handlers.redis_states', 'WARNING'):
+            states = mh.MessageHandler()._get_conversation_states()
+        self.assertEqual(await states.get_user_state('254700000004'), conversation_states.ConversationState.IDLE)
+
+
+class HangUpAfterRequestServer:
+    """Reads each request in full, then closes the connection without answering"""
+
+    def __init__(self):
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen()
+        self.url = 'http://127.0.0.1:%d' % self.listener.getsockname()[1]
+        self.requests_received = 0
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            with conn:
+                data = b''
+                while b'\r\n\r\n' not in data:
+                    data += conn.recv(4096)
+                head, _, body = data.partition(b'\r\n\r\n')
+                length = next(int(line.split(b':')[1]) for line in head.split(b'\r\n')
+                              if line.lower().startswith(b'content-length'))
+                while len(body) < length:
+                    body += conn.recv(4096)
+                self.requests_received += 1
+
+    def close(self):
+        self.listener.close()
+
+
+@mock.patch('bot.config.mpesa_config.MpesaConfig.validate_config', return_value=True)
+@mock.patch('bot.config.mpesa_config.MpesaConfig.generate_password', return_value=('pw', '20260101000000'))
+class StkPushRetryTests(SimpleTestCase):
+
+    def _service(self, base_url):
+        service = MpesaService()
+        service.base_url = base_url
+        service._get_access_token = lambda: 'token'
+        return service
+
+    def _push(self, service):
+        return service.initiate_stk_push('0712345678', 800, 'FRANKBEAUTY', 'Frank: hair')
+
+    async def test_connection_dropped_after_send_is_pending_not_retried(self, *_):
+        server = HangUpAfterRequestServer()
+        self.addCleanup(server.close)
+        service = self._service(server.url)
+
+        result = await mh._retry_transient(self._push, service, base=0)
+
+        self.assertTrue(result['pending'])
+        self.assertNotIn('retryable', result)
+        self.assertEqual(server.requests_received, 1)
+
+    def test_refused_connection_is_retryable(self, *_):
+        unused = socket.socket()
+        unused.bind(('127.0.0.1', 0))
+        port = unused.getsockname()[1]
+        unused.close()
+
+        result = self._push(self._service('http://127.0.0.1:%d' % port))
+
+        self.assertTrue(result['retryable'])
+        self.assertNotIn('pending', result)
@@ -0,0 +1,33 @@
+# bot/utils/fast_json.py
+"""
+JSON helpers for the per-message hot path (webhook bodies, Redis state).
+
+Uses orjson when it is installed - several times faster than the stdlib and
+it parses request.body bytes directly - and falls back to json otherwise.
+Both paths produce the same compact UTF-8 output.
+"""
+import json
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+if ORJSON_AVAILABLE:
+    def loads(data):
+        """Parse JSON from str or bytes"""
+        return orjson.loads(data)
+
+    def dumps(obj) -> str:
+        """Serialize to a compact JSON string"""
+        return orjson.dumps(obj).decode('utf-8')
+else:
+    def loads(data):
+        """Parse JSON from str or bytes"""
+        return json.loads(data)
+
+    def dumps(obj) -> str:
+        """Serialize to a compact JSON string"""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
@@ -0,0 +1,54 @@
+# bot/utils/log_queue.py
+import atexit
+import copy
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+_listeners = {}
+
+
+class _DeferredFormatQueueHandler(QueueHandler):
+    """
+    QueueHandler whose prepare() skips self.format().
+
+    The stock prepare() runs the formatter on the calling thread. Here only
+    the %-args are merged in (so later changes to logged objects can't leak
+    into the line); the Formatter - timestamps, tracebacks - runs on the
+    listener thread along with the stream I/O.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def install_queue_logging(logger_name='bot'):
+    """
+    Move a logger's handlers onto a background QueueListener thread.
+
+    The logger keeps a single QueueHandler, so the request thread only merges
+    each record's %-args and enqueues it; the formatter and stream/file I/O
+    run on the listener thread. Safe to call more than once.
+    """
+    if logger_name in _listeners:
+        return _listeners[logger_name]
+
+    target = logging.getLogger(logger_name)
+    handlers = [h for h in target.handlers if not isinstance(h, QueueHandler)]
+    if not handlers:
+        return None
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    for handler in handlers:
+        target.removeHandler(handler)
+    target.addHandler(_DeferredFormatQueueHandler(log_queue))
+
+    listener.start()
+    atexit.register(listener.stop)
+    _listeners[logger_name] = listener
+    return listener
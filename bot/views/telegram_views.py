@@ -1,32 +1,49 @@
 # bot/views/telegram_views.py
+import os
 import logging
-import json
+import concurrent.futures
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from bot.utils import fast_json
 
 logger = logging.getLogger(__name__)
 
+# One handler per process; its updates all run on the shared event loop
+_message_handler = None
+# The webhook answers after this long even if the update is still being handled
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv('WEBHOOK_TIMEOUT_SECONDS', '25'))
+
+def _get_message_handler():
+    global _message_handler
+    if _message_handler is None:
+        from bot.handlers.message_handler import MessageHandler
+        _message_handler = MessageHandler()
+    return _message_handler
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def telegram_webhook(request):
     """Handle Telegram webhook requests"""
     try:
-        # Parse the update
-        body = request.body.decode('utf-8')
-        update = json.loads(body)
+        # Parse the update straight from the request bytes
+        update = fast_json.loads(request.body)
         
-        logger.info(f"📨 Received Telegram update: {update}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📨 Received Telegram update: %s", update)
         
-        # Process the update
-        from bot.handlers.message_handler import MessageHandler
-        handler = MessageHandler()
-        handler.handle_update(update)
+        # Process the update on the shared loop instead of spinning one up per request
+        from bot.services import event_loop
+        try:
+            event_loop.run(_get_message_handler().handle_update(update), timeout=WEBHOOK_TIMEOUT_SECONDS)
+        except concurrent.futures.TimeoutError:
+            # Keeps running on the loop; answering now stops the platform from redelivering it
+            logger.warning("⚠️ Update still processing after %.0fs, acknowledging webhook", WEBHOOK_TIMEOUT_SECONDS)
         
         return JsonResponse({"status": "ok"})
         
     except Exception as e:
-        logger.error(f"❌ Error processing Telegram webhook: {e}")
+        logger.error("❌ Error processing Telegram webhook: %s", e)
         return JsonResponse({"status": "error", "error": str(e)}, status=500)
 
 @require_http_methods(["GET"])
@@ -43,7 +60,7 @@ def set_telegram_webhook(request):
             return JsonResponse({"status": "error", "message": "Failed to set webhook"}, status=500)
             
     except Exception as e:
-        logger.error(f"❌ Error setting Telegram webhook: {e}")
+        logger.error("❌ Error setting Telegram webhook: %s", e)
         return JsonResponse({"status": "error", "error": str(e)}, status=500)
 
 @require_http_methods(["GET"])
@@ -60,7 +77,7 @@ def delete_telegram_webhook(request):
             return JsonResponse({"status": "error", "message": "Failed to delete webhook"}, status=500)
             
     except Exception as e:
-        logger.error(f"❌ Error deleting Telegram webhook: {e}")
+        logger.error("❌ Error deleting Telegram webhook: %s", e)
         return JsonResponse({"status": "error", "error": str(e)}, status=500)
 
 @require_http_methods(["GET"])
@@ -91,7 +108,7 @@ def test_bot(request):
             return JsonResponse({"status": "error", "message": "Failed to send test message"}, status=500)
             
     except Exception as e:
-        logger.error(f"❌ Error testing bot: {e}")
+        logger.error("❌ Error testing bot: %s", e)
         return JsonResponse({"status": "error", "error": str(e)}, status=500)
 
 @csrf_exempt
@@ -99,10 +116,9 @@ def test_bot(request):
 def mpesa_callback(request):
     """Handle M-Pesa payment callbacks"""
     try:
-        body = request.body.decode('utf-8')
-        callback_data = json.loads(body)
+        callback_data = fast_json.loads(request.body)
         
-        logger.info(f"💰 M-Pesa callback received: {callback_data}")
+        logger.info("💰 M-Pesa callback received: %s", callback_data)
         
         # Process payment callback
         # Add your payment processing logic here
@@ -110,7 +126,7 @@ def mpesa_callback(request):
         return JsonResponse({"ResultCode": 0, "ResultDesc": "Success"})
         
     except Exception as e:
-        logger.error(f"❌ Error processing M-Pesa callback: {e}")
+        logger.error("❌ Error processing M-Pesa callback: %s", e)
         return JsonResponse({"ResultCode": 1, "ResultDesc": "Failed"}, status=500)
 
 @require_http_methods(["GET"])
@@ -129,7 +145,7 @@ def test_payment(request, phone_number, amount):
         return JsonResponse({"status": "initiated", "result": result})
         
     except Exception as e:
-        logger.error(f"❌ Error testing payment: {e}")
+        logger.error("❌ Error testing payment: %s", e)
         return JsonResponse({"status": "error", "error": str(e)}, status=500)
 
 @require_http_methods(["GET"])
@@ -1,8 +1,8 @@
 # bot/views/whatsapp_views.py
-import json
 import logging
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from bot.utils import fast_json
 from bot.handlers.whatsapp_conversation_handler import WhatsAppConversationHandler
 from bot.services.whatsapp_service import WhatsAppService
 
@@ -17,8 +17,8 @@ def whatsapp_webhook(request):
     """Handle WhatsApp webhook"""
     if request.method == 'POST':
         try:
-            data = json.loads(request.body)
-            logger.info(f"WhatsApp webhook received: {data}")
+            data = fast_json.loads(request.body)
+            logger.debug("WhatsApp webhook received: %s", data)
             
             # Extract message
             entries = data.get('entry', [])
@@ -45,7 +45,7 @@ def whatsapp_webhook(request):
             return JsonResponse({"status": "no_message"})
             
         except Exception as e:
-            logger.error(f"Error in WhatsApp webhook: {e}")
+            logger.error("Error in WhatsApp webhook: %s", e)
             return JsonResponse({"status": "error", "message": str(e)}, status=500)
     
     elif request.method == 'GET':
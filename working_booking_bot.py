@@ -20,6 +20,7 @@ django.setup()
 
 from django.conf import settings
 from bot.services.mpesa_service import MpesaService
+from bot.utils import fast_json
 
 # Import conversation handler modules
 from bot.handlers.conversation_states import (
@@ -37,6 +38,18 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Inline-button callback data -> WorkingBookingBot method.
+# Prefixed callbacks carry the service name after the prefix.
+_CALLBACK_EXACT_HANDLERS = {
+    'cancel_booking': 'cancel_booking',
+}
+_CALLBACK_PREFIX_HANDLERS = (
+    ('mpesa_stk_', 'start_mpesa_checkout'),
+    ('mpesa_manual_', 'show_manual_mpesa'),
+    ('mpesa_info_', 'show_mpesa_info'),
+    ('cash_', 'confirm_cash_payment'),
+)
+
 class NetworkResilientTelegramClient:
     """Telegram client with Railway-optimized network handling"""
     
@@ -94,13 +107,14 @@ class NetworkResilientTelegramClient:
             )
             
             if response.status_code == 200:
-                return response.json()
+                # Parse the raw bytes - orjson when available, up to 100 updates per poll
+                return fast_json.loads(response.content)
             return None
                 
         except requests.exceptions.Timeout:
             return {'ok': True, 'result': []}
         except Exception as e:
-            logger.error(f"Connection error: {e}")
+            logger.error("Connection error: %s", e)
             return None
     
     def send_message(self, chat_id, text, parse_mode='Markdown', reply_markup=None):
@@ -118,13 +132,13 @@ class NetworkResilientTelegramClient:
             response = self.session.post(f"{self.base_url}/sendMessage", json=payload, timeout=15)
             
             if response.status_code == 200:
-                logger.info(f"✅ Message sent to {chat_id}")
+                logger.info("✅ Message sent to %s", chat_id)
             else:
-                logger.error(f"❌ Failed to send message: {response.status_code}")
+                logger.error("❌ Failed to send message: %s", response.status_code)
                 
             return response.json()
         except Exception as e:
-            logger.error(f"❌ Send error: {e}")
+            logger.error("❌ Send error: %s", e)
             return None
     
     def send_message_with_buttons(self, chat_id, text, buttons):
@@ -142,7 +156,7 @@ class NetworkResilientTelegramClient:
             response = self.session.post(f"{self.base_url}/answerCallbackQuery", json=payload, timeout=5)
             return response.json()
         except Exception as e:
-            logger.error(f"❌ Error answering callback: {e}")
+            logger.error("❌ Error answering callback: %s", e)
             return None
 
 class WorkingBookingBot:
@@ -170,14 +184,14 @@ class WorkingBookingBot:
             elif 'callback_query' in update:
                 self.handle_callback(update['callback_query'])
         except Exception as e:
-            logger.error(f"Error handling update: {e}")
+            logger.error("Error handling update: %s", e)
     
     def handle_message(self, message):
         """Handle incoming messages with ConversationHandler"""
         chat_id = message['chat']['id']
         text = message.get('text', '').strip()
         
-        logger.info(f"📨 Message from {chat_id}: {text}")
+        logger.info("📨 Message from %s: %s", chat_id, text)
         
         if text.startswith('/'):
             self.handle_command(chat_id, text)
@@ -375,11 +389,11 @@ Ili kukusanyia appointment ya {service}, tafadhali niambie:
                 created_at=datetime.now()
             )
             
-            logger.info(f"✅ Appointment saved for {chat_id}")
+            logger.info("✅ Appointment saved for %s", chat_id)
             return True
             
         except Exception as e:
-            logger.error(f"❌ Error saving appointment: {e}")
+            logger.error("❌ Error saving appointment: %s", e)
             return False
     
     def send_payment_options(self, chat_id, appointment):
@@ -541,38 +555,50 @@ M-Pesa payments are ready to use! 🎉
     
     def handle_callback(self, callback_query):
         """Handle button callbacks with improved error handling"""
-        chat_id = callback_query['message']['chat']['id']
-        data = callback_query['data']
-        callback_query_id = callback_query['id']
+        callback_query_id = callback_query.get('id')
+        chat_id = callback_query.get('message', {}).get('chat', {}).get('id')
+        data = callback_query.get('data')
+        
+        # Validate before any API call - malformed callbacks have nothing to act on
+        if not callback_query_id or chat_id is None or not data:
+            logger.debug("Ignoring malformed callback query: %s", callback_query)
+            return
         
-        logger.info(f"🔘 CALLBACK: {data}")
+        resolved = self._resolve_callback(data)
+        if resolved is None:
+            # Stale/unknown button: the toast is the only reply needed
+            logger.debug("Unknown callback data from %s: %s", chat_id, data)
+            self.telegram.answer_callback_query(callback_query_id, "❌ Unknown action. Please try again.")
+            return
+        
+        logger.info("🔘 CALLBACK: %s", data)
         self.telegram.answer_callback_query(callback_query_id, "Processing...")
         
         try:
-            if data.startswith('mpesa_stk_'):
-                service = data.replace('mpesa_stk_', '')
-                self.start_mpesa_checkout(chat_id, service)
-            elif data.startswith('mpesa_manual_'):
-                service = data.replace('mpesa_manual_', '')
-                self.show_manual_mpesa(chat_id, service)
-            elif data.startswith('mpesa_info_'):
-                service = data.replace('mpesa_info_', '')
-                self.show_mpesa_info(chat_id, service)
-            elif data.startswith('cash_'):
-                service = data.replace('cash_', '')
-                self.confirm_cash_payment(chat_id, service)
-            elif data == 'cancel_booking':
-                # Clear conversation state
-                from bot.handlers.conversation_states import clear_user_state
-                clear_user_state(chat_id)
-                self.send_message(chat_id, "❌ Booking cancelled. Let me know if you change your mind! 😊")
-            else:
-                self.send_message(chat_id, "❌ Unknown action. Please try again.")
+            handler, args = resolved
+            handler(chat_id, *args)
                 
         except Exception as e:
-            logger.error(f"❌ Callback error: {e}")
+            logger.error("❌ Callback error: %s", e)
             self.send_message(chat_id, "❌ Error processing your request. Please try again.")
     
+    def _resolve_callback(self, data):
+        """Look up the handler for callback data - returns (method, args) or None if unknown"""
+        name = _CALLBACK_EXACT_HANDLERS.get(data)
+        if name is not None:
+            return getattr(self, name), ()
+        for prefix, name in _CALLBACK_PREFIX_HANDLERS:
+            if data.startswith(prefix):
+                return getattr(self, name), (data[len(prefix):],)
+        return None
+    
+    def cancel_booking(self, chat_id):
+        """Cancel the booking in progress"""
+        # Clear conversation state
+        from bot.handlers.conversation_states import clear_user_state
+        clear_user_state(chat_id)
+        self.send_message(chat_id, "❌ Booking cancelled. Let me know if you change your mind! 😊")
+    
     def start_mpesa_checkout(self, chat_id, service):
         """Start M-Pesa STK Push checkout"""
         try:
@@ -595,10 +621,10 @@ I'll send a payment request to your phone! 📲
                 'service': service,
                 'payment_method': 'mpesa_stk'
             }
-            logger.info(f"✅ M-Pesa checkout started for {service}")
+            logger.info("✅ M-Pesa checkout started for %s", service)
             
         except Exception as e:
-            logger.error(f"❌ Error starting M-Pesa checkout: {e}")
+            logger.error("❌ Error starting M-Pesa checkout: %s", e)
             self.send_message(chat_id, "❌ Error starting payment. Please try again.")
     
     def show_mpesa_info(self, chat_id, service):
@@ -646,10 +672,10 @@ Tom Mboya Street, Nairobi CBD
             """
             
             self.send_message(chat_id, instructions)
-            logger.info(f"📋 Manual M-Pesa shown for {service}")
+            logger.info("📋 Manual M-Pesa shown for %s", service)
             
         except Exception as e:
-            logger.error(f"❌ Error showing manual instructions: {e}")
+            logger.error("❌ Error showing manual instructions: %s", e)
             self.send_message(chat_id, "Error loading instructions. Please try /book again.")
     
     def confirm_cash_payment(self, chat_id, service):
@@ -676,7 +702,7 @@ We look forward to seeing you! 😊
         """
         
         self.send_message(chat_id, confirmation)
-        logger.info(f"💵 Cash payment confirmed for {service}")
+        logger.info("💵 Cash payment confirmed for %s", service)
         # Clear conversation state after confirmation
         from bot.handlers.conversation_states import clear_user_state
         clear_user_state(chat_id)